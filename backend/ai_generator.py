@@ -1,65 +1,126 @@
-from typing import Any, Dict, List, Optional
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 import anthropic
+import httpx
+from response_cache import SemanticResponseCache
 
 
 class AIGenerator:
     """Handles interactions with Anthropic's Claude API for generating responses"""
 
     # Static system prompt to avoid rebuilding on each call
-    SYSTEM_PROMPT = """ You are an AI assistant specialized in course materials and educational content with access to search tools for course information.
-
-Tool Usage Guidelines:
-- **Content search**: Use 'search_course_content' for questions about specific course content or detailed educational materials
-- **Course outlines**: Use 'get_course_outline' for questions about course structure, lessons, or overviews
-- **Sequential tool usage**: You can use tools across multiple rounds (up to 2 rounds maximum) to build comprehensive answers
-- **Multi-step queries**: For complex questions requiring multiple searches, use tools strategically across rounds
-- Synthesize search results into accurate, fact-based responses
-- If search yields no results, state this clearly without offering alternatives
-
-Sequential Tool Strategy:
-- **Round 1**: Use initial tools to gather foundational information (e.g., course outlines, broad searches)
-- **Round 2**: Use follow-up tools to refine, expand, or compare information from Round 1 results
-- **Build context**: Each round should build upon previous tool results for comprehensive answers
-- **Avoid repetition**: Don't repeat identical tool calls; use different parameters or approaches
-- **Complex queries**: Break down multi-part questions across rounds (outline → specific content, compare courses, etc.)
-
-Response Protocol:
-- **General knowledge questions**: Answer using existing knowledge without searching
-- **Course-specific questions**: Search first, then answer
-- **Comparison questions**: Use multiple rounds to gather information about each subject
-- **Course outline requests**: Use outline tool and present complete information including:
-  - Course title
-  - Course link (if available)  
-  - Number of lessons
-  - Lesson titles with numbers
-- **No meta-commentary**:
- - Provide direct answers only — no reasoning process, search explanations, or question-type analysis
- - Do not mention "based on the search results" or describe your search process
- - Focus on the final synthesized answer from all rounds
-
-All responses must be:
-1. **Brief, Concise and focused** - Get to the point quickly
-2. **Educational** - Maintain instructional value
-3. **Clear** - Use accessible language
-4. **Example-supported** - Include relevant examples when they aid understanding
-5. **Comprehensive** - Use multiple tool rounds when beneficial for complete answers
-Provide only the direct answer to what was asked.
+    SYSTEM_PROMPT = """You answer questions about course materials, using tools to search course information.
+
+Tools and rounds:
+- 'search_course_content': specific course content or detailed material
+- 'get_course_outline': course structure, lessons, or overviews; give the course title, course link (if available), lesson count, and every lesson number and title
+- Up to 2 rounds of tool use: Round 1 gathers broadly (outlines, wide searches), Round 2 refines, expands, or compares using Round 1 results; never repeat an identical call
+- Answer general knowledge questions without tools; search before answering course-specific ones
+- Split comparisons and multi-part questions across rounds
+- If a search finds nothing, say so plainly without offering alternatives
+
+Answers must be brief and focused, educational, clear, fact-based, and use examples where they help. Give only the final synthesized answer: no reasoning, search descriptions, or phrases like "based on the search results".
 """
 
-    def __init__(self, api_key: str, model: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+    # Marks a content block as a prompt-caching breakpoint
+    CACHE_CONTROL = {"type": "ephemeral"}
+
+    # Shared tool_choice values; the SDK only reads them
+    TOOL_CHOICE_AUTO = {"type": "auto"}
+    TOOL_CHOICE_NONE = {"type": "none"}
+
+    # Static system prompt block. It carries no cache breakpoint: the prompt
+    # is ~250 tokens and the tool definitions ~220, well under the 1024-token
+    # minimum cacheable prefix for Sonnet, so a breakpoint on either would
+    # never be written. Tool rounds still cache them as part of the prefix
+    # behind the tool-result breakpoint.
+    SYSTEM_BLOCK = {"type": "text", "text": SYSTEM_PROMPT}
+
+    # System content for calls without conversation history; never mutated
+    SYSTEM_BLOCKS = [SYSTEM_BLOCK]
+
+    # Two-subject comparison phrasings that can be answered by researching
+    # each subject independently; each must span the whole question, so a
+    # comparison inside a longer question is answered normally
+    COMPARISON_PATTERNS = (
+        re.compile(
+            r"^(?:what(?:'s| is| are) )?(?:the )?differences? between "
+            r"(?P<a>.+?) and (?P<b>.+?)[?.!]*$",
+            re.IGNORECASE,
+        ),
+        re.compile(
+            r"^compare (?P<a>.+?) (?:and|with|to) (?P<b>.+?)[?.!]*$", re.IGNORECASE
+        ),
+        re.compile(r"^(?P<a>.+?) (?:vs\.?|versus) (?P<b>.+?)[?.!]*$", re.IGNORECASE),
+    )
+
+    # A captured subject must read like a topic name; longer captures or
+    # ones containing these words are part of a wider question or refer
+    # back to earlier context
+    MAX_SUBJECT_WORDS = 4
+    NON_SUBJECT_WORDS = frozenset(
+        "and or but how what which why when where who is are does do can "
+        "should i me you explain tell show it this that these those them "
+        "one".split()
+    )
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        timeout: float = 30.0,
+        response_cache: Optional[SemanticResponseCache] = None,
+    ):
+        # One long-lived HTTP/2 connection pool per generator: follow-up tool
+        # rounds reuse the warm TLS connection and concurrent requests are
+        # multiplexed over it
+        http_client = anthropic.DefaultAsyncHttpxClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=120),
+        )
+
+        # Bound every request so a stalled connection fails fast instead of
+        # hanging the worker; retries are handled by the client
+        self.client = anthropic.AsyncAnthropic(
+            api_key=api_key, timeout=timeout, http_client=http_client
+        )
         self.model = model
 
+        # Dedicated pool for blocking tool calls so they don't compete with
+        # other work on the event loop's default executor
+        self.tool_executor = ThreadPoolExecutor(
+            max_workers=8, thread_name_prefix="tool"
+        )
+
+        # Optional semantic cache for answers that needed no tools
+        self.response_cache = response_cache
+
+        # Cache write-backs still running; holding them here keeps the
+        # futures alive until they finish
+        self._pending_writes: Set[asyncio.Future] = set()
+
         # Pre-build base API parameters
         self.base_params = {"model": self.model, "temperature": 0, "max_tokens": 800}
 
-    def generate_response(
+    async def close(self) -> None:
+        """Release the HTTP connection pool and the tool thread pool"""
+        # Let background cache writes finish before their pool goes away
+        await asyncio.gather(*self._pending_writes, return_exceptions=True)
+        self.tool_executor.shutdown(wait=False)
+        await self.client.close()
+
+    async def generate_response(
         self,
         query: str,
         conversation_history: Optional[str] = None,
         tools: Optional[List] = None,
         tool_manager=None,
+        cache_key: Optional[str] = None,
+        sources: Optional[List] = None,
     ) -> str:
         """
         Generate AI response with optional tool usage and conversation context.
@@ -69,46 +130,234 @@ Provide only the direct answer to what was asked.
             conversation_history: Previous messages for context
             tools: Available tools the AI can use
             tool_manager: Manager to execute tools
+            cache_key: The user's question as asked, before any prompt
+                wrapping; used for the response cache, which is skipped when
+                there is conversation history, and to detect comparisons
+            sources: Per-query list that tools append the sources they used to
 
         Returns:
             Generated response as string
         """
-
-        # Build system content efficiently - avoid string ops when possible
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history
-            else self.SYSTEM_PROMPT
-        )
+        loop = asyncio.get_running_loop()
+
+        # Serve repeated or paraphrased standalone questions without calling
+        # Claude; follow-ups depend on history and are never cached
+        use_cache = bool(self.response_cache and cache_key and not conversation_history)
+        if use_cache:
+            cached = await loop.run_in_executor(
+                self.tool_executor, self.response_cache.get, cache_key
+            )
+            if cached is not None:
+                return cached
+
+        # Research each side of a comparison concurrently rather than one
+        # subject per sequential tool round; detection uses the raw question,
+        # since query may be wrapped in instructions
+        if tools and tool_manager and cache_key:
+            subjects = self._split_comparison(cache_key)
+            if subjects:
+                return await self._fanout(
+                    query,
+                    cache_key,
+                    subjects,
+                    conversation_history,
+                    tools,
+                    tool_manager,
+                    sources,
+                )
 
         # Prepare API call parameters efficiently
         api_params = {
             **self.base_params,
             "messages": [{"role": "user", "content": query}],
-            "system": system_content,
+            "system": self._build_system(conversation_history),
         }
 
         # Add tools if available
         if tools:
             api_params["tools"] = tools
-            api_params["tool_choice"] = {"type": "auto"}
+            api_params["tool_choice"] = self.TOOL_CHOICE_AUTO
 
         # Get response from Claude
-        response = self.client.messages.create(**api_params)
+        response = await self.client.messages.create(**api_params)
 
         # Handle tool execution if needed
         if response.stop_reason == "tool_use" and tool_manager:
-            return self._handle_tool_execution(response, api_params, tool_manager)
+            return await self._handle_tool_execution(
+                response, api_params, tool_manager, sources=sources
+            )
+
+        answer = response.content[0].text
+
+        # Only answers given without tools are cached, since tool results
+        # depend on course content that can change. The write embeds the
+        # question and hits disk, so it runs in the background rather than
+        # delaying the answer
+        if use_cache and response.stop_reason != "tool_use":
+            write = loop.run_in_executor(
+                self.tool_executor, self.response_cache.set, cache_key, answer
+            )
+            self._pending_writes.add(write)
+            write.add_done_callback(self._pending_writes.discard)
 
         # Return direct response
+        return answer
+
+    async def generate_batch(
+        self,
+        queries: List[Tuple[str, Optional[str]]],
+        poll_interval: float = 5.0,
+    ) -> List[Optional[str]]:
+        """
+        Generate responses for many queries through the Message Batches API.
+
+        Intended for offline workloads such as evaluation runs, where batch
+        pricing and throughput matter more than latency. Tools are not
+        offered, since a batch cannot run the tool execution loop.
+
+        Args:
+            queries: (query, conversation_history) pairs
+            poll_interval: Seconds to wait between batch status checks
+
+        Returns:
+            Responses in the same order as queries, with None for requests
+            that did not succeed
+        """
+        # Index-based ids stay unique even when the same query repeats
+        requests = [
+            {
+                "custom_id": f"query-{index}",
+                "params": {
+                    **self.base_params,
+                    "messages": [{"role": "user", "content": query}],
+                    "system": self._build_system(conversation_history),
+                },
+            }
+            for index, (query, conversation_history) in enumerate(queries)
+        ]
+
+        batch = await self.client.messages.batches.create(requests=requests)
+        while batch.processing_status != "ended":
+            await asyncio.sleep(poll_interval)
+            batch = await self.client.messages.batches.retrieve(batch.id)
+
+        # Results arrive in arbitrary order; match them back by custom_id
+        responses: List[Optional[str]] = [None] * len(queries)
+        async for entry in await self.client.messages.batches.results(batch.id):
+            if entry.result.type == "succeeded":
+                index = int(entry.custom_id.removeprefix("query-"))
+                responses[index] = entry.result.message.content[0].text
+
+        return responses
+
+    def _split_comparison(self, question: str) -> List[str]:
+        """Return the subjects of a comparison question, or an empty list"""
+        for pattern in self.COMPARISON_PATTERNS:
+            match = pattern.match(question.strip())
+            if match:
+                subjects = [match.group("a").strip(), match.group("b").strip()]
+                if all(self._is_subject(subject) for subject in subjects):
+                    return subjects
+        return []
+
+    def _is_subject(self, text: str) -> bool:
+        """Check that a captured comparison side is a short topic name"""
+        words = text.split()
+        return (
+            0 < len(words) <= self.MAX_SUBJECT_WORDS
+            and not any(mark in text for mark in ",;:")
+            and not any(word.lower() in self.NON_SUBJECT_WORDS for word in words)
+        )
+
+    async def _fanout(
+        self,
+        query: str,
+        question: str,
+        subjects: List[str],
+        conversation_history: Optional[str],
+        tools: List,
+        tool_manager,
+        sources: Optional[List] = None,
+    ) -> str:
+        """
+        Answer a comparison by researching each subject in parallel.
+
+        Args:
+            query: The comparison prompt, as sent to Claude
+            question: The user's question as asked
+            subjects: Subjects to research independently
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+            sources: Per-query list shared by every subject's research
+
+        Returns:
+            Synthesized response comparing the subjects
+        """
+        # Each subquery carries the full question, since a split subject can
+        # lose a shared noun or qualifier ("supervised and unsupervised
+        # learning", "Python vs JavaScript for data science")
+        async with asyncio.TaskGroup() as group:
+            tasks = [
+                group.create_task(
+                    self.generate_response(
+                        f"What do the course materials say about {subject}? "
+                        f'This is one part of the question "{question}".',
+                        conversation_history,
+                        tools,
+                        tool_manager,
+                        sources=sources,
+                    )
+                )
+                for subject in subjects
+            ]
+
+        findings = "\n\n".join(
+            f"{subject}:\n{task.result()}" for subject, task in zip(subjects, tasks)
+        )
+
+        # Final synthesis works only from the findings, so no tools are offered
+        response = await self.client.messages.create(
+            **self.base_params,
+            messages=[
+                {
+                    "role": "user",
+                    "content": f"{query}\n\nFindings for each subject:\n\n{findings}",
+                }
+            ],
+            system=self._build_system(conversation_history),
+        )
         return response.content[0].text
 
-    def _handle_tool_execution(
+    def _build_system(self, conversation_history: Optional[str]) -> List:
+        """Build system content with the static prompt first"""
+        # Keep the static prompt as its own block so the request prefix stays
+        # identical across sessions; conversation history varies and goes after it
+        if not conversation_history:
+            return self.SYSTEM_BLOCKS
+
+        return [
+            self.SYSTEM_BLOCK,
+            {
+                "type": "text",
+                "text": f"Previous conversation:\n{conversation_history}",
+            },
+        ]
+
+    def _tool_result_content(self, outcome: Union[str, Exception]) -> str:
+        """Convert a tool outcome into tool_result text"""
+        # Every tool returns formatted text, so only failures need converting
+        if isinstance(outcome, Exception):
+            return f"Error executing tool: {str(outcome)}"
+        return outcome
+
+    async def _handle_tool_execution(
         self,
         initial_response,
         base_params: Dict[str, Any],
         tool_manager,
         max_rounds: int = 2,
+        sources: Optional[List] = None,
     ):
         """
         Handle execution of tool calls with support for sequential rounds.
@@ -118,64 +367,92 @@ Provide only the direct answer to what was asked.
             base_params: Base API parameters
             tool_manager: Manager to execute tools
             max_rounds: Maximum number of tool execution rounds (default 2)
+            sources: Per-query list that tools append the sources they used to
 
         Returns:
             Final response text after all tool execution rounds
         """
-        # Initialize state for iterative tool calling
-        messages = base_params["messages"].copy()
+        # Initialize state for iterative tool calling; the shallow copy keeps
+        # the initial request's messages unchanged as rounds are added
+        loop = asyncio.get_running_loop()
+        messages = list(base_params["messages"])
         current_response = initial_response
         round_count = 0
+        cached_result: Optional[Dict[str, Any]] = None
+
+        # Build follow-up parameters once; messages grows in place each round
+        round_params = {
+            **self.base_params,
+            "messages": messages,
+            "system": base_params["system"],
+            "tools": base_params.get("tools", []),
+            "tool_choice": self.TOOL_CHOICE_AUTO,
+        }
 
         # Iterative tool execution loop
         while round_count < max_rounds and current_response.stop_reason == "tool_use":
             round_count += 1
 
+            # A tool_use stop without tool_use blocks is malformed; another
+            # request would only repeat it, so answer with what we have
+            tool_blocks = [
+                block for block in current_response.content if block.type == "tool_use"
+            ]
+            if not tool_blocks:
+                break
+
             # Add AI's tool use response to conversation
             messages.append({"role": "assistant", "content": current_response.content})
 
-            # Execute all tool calls in this round
-            tool_results = []
-            for content_block in current_response.content:
-                if content_block.type == "tool_use":
-                    try:
-                        tool_result = tool_manager.execute_tool(
-                            content_block.name, **content_block.input
-                        )
-                    except Exception as e:
-                        # Handle tool execution errors gracefully
-                        tool_result = f"Error executing tool: {str(e)}"
-
-                    tool_results.append(
-                        {
-                            "type": "tool_result",
-                            "tool_use_id": content_block.id,
-                            "content": tool_result,
-                        }
+            # Execute all tool calls in this round concurrently; tools are
+            # blocking, so each one runs on the tool thread pool
+            outcomes = await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        self.tool_executor,
+                        partial(
+                            tool_manager.execute_tool,
+                            block.name,
+                            sources=sources,
+                            **block.input,
+                        ),
                     )
+                    for block in tool_blocks
+                ),
+                return_exceptions=True,
+            )
+
+            # Handle tool execution errors gracefully
+            tool_results = [
+                {
+                    "type": "tool_result",
+                    "tool_use_id": block.id,
+                    "content": self._tool_result_content(outcome),
+                }
+                for block, outcome in zip(tool_blocks, outcomes)
+            ]
+
+            # Move the cache breakpoint to the newest tool result so the next
+            # round reads the whole prior conversation from cache instead of
+            # re-ingesting it; one moving breakpoint keeps us within the
+            # API's breakpoint limit for any max_rounds
+            if cached_result is not None:
+                cached_result.pop("cache_control")
+            cached_result = tool_results[-1]
+            cached_result["cache_control"] = self.CACHE_CONTROL
 
             # Add tool results to conversation
-            if tool_results:
-                messages.append({"role": "user", "content": tool_results})
-
-            # Prepare parameters for next round (keep tools available)
-            round_params = {
-                **self.base_params,
-                "messages": messages,
-                "system": base_params["system"],
-            }
-
-            # Only add tools if we haven't reached max rounds
-            if round_count < max_rounds:
-                round_params["tools"] = base_params.get("tools", [])
-                round_params["tool_choice"] = {"type": "auto"}
+            messages.append({"role": "user", "content": tool_results})
 
-            # Get response for this round
-            current_response = self.client.messages.create(**round_params)
+            # On the final round keep tools in the request so the cached
+            # prefix (tools, system, prior turns) still matches, and forbid
+            # tool use instead so Claude must answer
+            if round_count == max_rounds:
+                round_params["tool_choice"] = self.TOOL_CHOICE_NONE
 
-            # If no more tool use, break early
-            if current_response.stop_reason != "tool_use":
-                break
+            # Get response for this round; the loop condition stops as soon
+            # as Claude answers without requesting more tools
+            current_response = await self.client.messages.create(**round_params)
 
         # Return final response text
         return current_response.content[0].text
@@ -9,12 +9,17 @@ from config import config
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from rag_system import RAGSystem
 
 # Initialize FastAPI app
-app = FastAPI(title="Course Materials RAG System", root_path="")
+app = FastAPI(
+    title="Course Materials RAG System",
+    root_path="",
+    default_response_class=ORJSONResponse,
+)
 
 # Add trusted host middleware for proxy
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
@@ -69,7 +74,7 @@ async def query_documents(request: QueryRequest):
             session_id = rag_system.session_manager.create_session()
 
         # Process query using RAG system
-        answer, sources = rag_system.query(request.query, session_id)
+        answer, sources = await rag_system.query(request.query, session_id)
 
         return QueryResponse(answer=answer, sources=sources, session_id=session_id)
     except Exception as e:
@@ -104,6 +109,12 @@ async def startup_event():
             print(f"Error loading documents: {e}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close the AI client's connections and tool threads"""
+    await rag_system.ai_generator.close()
+
+
 import os
 from pathlib import Path
 
@@ -24,6 +24,10 @@ class Config:
     MAX_RESULTS: int = 5  # Maximum search results to return
     MAX_HISTORY: int = 2  # Number of conversation messages to remember
 
+    # Response cache settings
+    RESPONSE_CACHE_THRESHOLD: float = 0.90  # Min cosine similarity for a cache hit
+    RESPONSE_CACHE_TTL: float = 3600.0  # Seconds before a cached answer expires
+
     # Database paths
     CHROMA_PATH: str = "./chroma_db"  # ChromaDB storage location
 
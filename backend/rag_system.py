@@ -1,9 +1,10 @@
 import os
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 from ai_generator import AIGenerator
 from document_processor import DocumentProcessor
 from models import Course, CourseChunk, Lesson
+from response_cache import SemanticResponseCache
 from search_tools import CourseOutlineTool, CourseSearchTool, ToolManager
 from session_manager import SessionManager
 from vector_store import VectorStore
@@ -22,8 +23,15 @@ class RAGSystem:
         self.vector_store = VectorStore(
             config.CHROMA_PATH, config.EMBEDDING_MODEL, config.MAX_RESULTS
         )
+        self.response_cache = SemanticResponseCache(
+            self.vector_store,
+            config.RESPONSE_CACHE_THRESHOLD,
+            config.RESPONSE_CACHE_TTL,
+        )
         self.ai_generator = AIGenerator(
-            config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL
+            config.ANTHROPIC_API_KEY,
+            config.ANTHROPIC_MODEL,
+            response_cache=self.response_cache,
         )
         self.session_manager = SessionManager(config.MAX_HISTORY)
 
@@ -81,6 +89,8 @@ class RAGSystem:
         if clear_existing:
             print("Clearing existing data for fresh rebuild...")
             self.vector_store.clear_all_data()
+            # Cached answers were given against the old content
+            self.response_cache.clear()
 
         if not os.path.exists(folder_path):
             print(f"Folder {folder_path} does not exist")
@@ -119,9 +129,9 @@ class RAGSystem:
 
         return total_courses, total_chunks
 
-    def query(
+    async def query(
         self, query: str, session_id: Optional[str] = None
-    ) -> Tuple[str, List[str]]:
+    ) -> Tuple[str, List[Dict[str, Any]]]:
         """
         Process a user query using the RAG system with tool-based search.
 
@@ -130,7 +140,7 @@ class RAGSystem:
             session_id: Optional session ID for conversation context
 
         Returns:
-            Tuple of (response, sources list - empty for tool-based approach)
+            Tuple of (response, sources found by the tools for this query)
         """
         # Create prompt for the AI with clear instructions
         prompt = f"""Answer this question about course materials: {query}"""
@@ -140,20 +150,20 @@ class RAGSystem:
         if session_id:
             history = self.session_manager.get_conversation_history(session_id)
 
+        # Sources are collected per query; the tools are shared by concurrent
+        # requests, so nothing query-specific is kept on them
+        sources: List[Dict[str, Any]] = []
+
         # Generate response using AI with tools
-        response = self.ai_generator.generate_response(
+        response = await self.ai_generator.generate_response(
             query=prompt,
             conversation_history=history,
             tools=self.tool_manager.get_tool_definitions(),
             tool_manager=self.tool_manager,
+            cache_key=query,
+            sources=sources,
         )
 
-        # Get sources from the search tool
-        sources = self.tool_manager.get_last_sources()
-
-        # Reset sources after retrieving them
-        self.tool_manager.reset_sources()
-
         # Update conversation history
         if session_id:
             self.session_manager.add_exchange(session_id, query, response)
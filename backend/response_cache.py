@@ -0,0 +1,104 @@
+import hashlib
+import time
+from typing import Optional
+
+from vector_store import VectorStore
+
+
+class SemanticResponseCache:
+    """Caches answers keyed by query embedding so paraphrased questions hit"""
+
+    COLLECTION_NAME = "response_cache"
+
+    # Neighbours checked per lookup, so an expired nearest entry doesn't
+    # hide a fresh paraphrase just behind it
+    NEIGHBOURS = 5
+
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        similarity_threshold: float = 0.90,
+        ttl_seconds: float = 3600.0,
+    ):
+        self.similarity_threshold = similarity_threshold
+        # Answers older than this are ignored, so edits to course content
+        # stop being masked by stale answers once the TTL passes
+        self.ttl_seconds = ttl_seconds
+        self.vector_store = vector_store
+        self.collection = self._create_collection()
+
+    def _create_collection(self):
+        """Create or get the cache collection"""
+        # Reuse the store's client and embedding model; cosine space makes
+        # the distance threshold independent of embedding magnitude
+        return self.vector_store.client.get_or_create_collection(
+            name=self.COLLECTION_NAME,
+            embedding_function=self.vector_store.embedding_function,
+            metadata={"hnsw:space": "cosine"},
+        )
+
+    def get(self, query: str) -> Optional[str]:
+        """Return the answer of the nearest unexpired query, if similar enough"""
+        try:
+            results = self.collection.query(
+                query_texts=[query], n_results=self.NEIGHBOURS
+            )
+        except Exception as e:
+            print(f"Error reading response cache: {e}")
+            return None
+
+        if not results["distances"] or not results["distances"][0]:
+            return None
+
+        # Neighbours come nearest first; entries written before expiry
+        # tracking have no timestamp and count as expired
+        expires_before = time.time() - self.ttl_seconds
+        answer = None
+        expired_ids = []
+        for entry_id, distance, metadata in zip(
+            results["ids"][0], results["distances"][0], results["metadatas"][0]
+        ):
+            if metadata.get("created_at", 0) < expires_before:
+                expired_ids.append(entry_id)
+            # Cosine distance is 1 - cosine similarity
+            elif answer is None and 1 - distance >= self.similarity_threshold:
+                answer = metadata["answer"]
+
+        # Drop expired entries as they are found so they stop taking up
+        # neighbour slots
+        if expired_ids:
+            self._delete(ids=expired_ids)
+
+        return answer
+
+    def set(self, query: str, answer: str) -> None:
+        """Store an answer for a query, replacing any previous answer"""
+        now = time.time()
+        try:
+            self.collection.upsert(
+                ids=[hashlib.sha1(query.encode("utf-8")).hexdigest()],
+                documents=[query],
+                metadatas=[{"answer": answer, "created_at": now}],
+            )
+        except Exception as e:
+            print(f"Error writing response cache: {e}")
+            return
+
+        # Every distinct wording adds a row, so prune expired ones on write to
+        # keep the persistent collection bounded across restarts
+        self._delete(where={"created_at": {"$lt": now - self.ttl_seconds}})
+
+    def _delete(self, **filters) -> None:
+        """Delete cache entries matching the given ids or where filter"""
+        try:
+            self.collection.delete(**filters)
+        except Exception as e:
+            print(f"Error pruning response cache: {e}")
+
+    def clear(self) -> None:
+        """Drop every cached answer"""
+        try:
+            self.vector_store.client.delete_collection(self.COLLECTION_NAME)
+            self.collection = self._create_collection()
+        except Exception as e:
+            print(f"Error clearing response cache: {e}")
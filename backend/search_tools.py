@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional, Protocol
+from typing import Any, Dict, List, Optional, Protocol
 
 from vector_store import SearchResults, VectorStore
 
@@ -7,6 +7,9 @@ from vector_store import SearchResults, VectorStore
 class Tool(ABC):
     """Abstract base class for all tools"""
 
+    # Tools that report sources accept a per-query `sources` list in execute()
+    tracks_sources = False
+
     @abstractmethod
     def get_tool_definition(self) -> Dict[str, Any]:
         """Return Anthropic tool definition for this tool"""
@@ -21,9 +24,10 @@ class Tool(ABC):
 class CourseSearchTool(Tool):
     """Tool for searching course content with semantic course name matching"""
 
+    tracks_sources = True
+
     def __init__(self, vector_store: VectorStore):
         self.store = vector_store
-        self.last_sources = []  # Track sources from last search
 
     def get_tool_definition(self) -> Dict[str, Any]:
         """Return Anthropic tool definition for this tool"""
@@ -55,6 +59,7 @@ class CourseSearchTool(Tool):
         query: str,
         course_name: Optional[str] = None,
         lesson_number: Optional[int] = None,
+        sources: Optional[List[Dict[str, Any]]] = None,
     ) -> str:
         """
         Execute the search tool with given parameters.
@@ -63,6 +68,7 @@ class CourseSearchTool(Tool):
             query: What to search for
             course_name: Optional course filter
             lesson_number: Optional lesson filter
+            sources: Per-query list the sources of the results are appended to
 
         Returns:
             Formatted search results or error message
@@ -87,12 +93,16 @@ class CourseSearchTool(Tool):
             return f"No relevant content found{filter_info}."
 
         # Format and return results
-        return self._format_results(results)
+        return self._format_results(results, sources)
 
-    def _format_results(self, results: SearchResults) -> str:
+    def _format_results(
+        self,
+        results: SearchResults,
+        sources: Optional[List[Dict[str, Any]]] = None,
+    ) -> str:
         """Format search results with course and lesson context"""
         formatted = []
-        sources = []  # Track sources for the UI
+        found = []  # Track sources for the UI
 
         for doc, meta in zip(results.documents, results.metadata):
             course_title = meta.get("course_title", "unknown")
@@ -120,14 +130,16 @@ class CourseSearchTool(Tool):
 
             # Store source with link information
             if lesson_link:
-                sources.append({"text": source_text, "link": lesson_link})
+                found.append({"text": source_text, "link": lesson_link})
             else:
-                sources.append({"text": source_text, "link": None})
+                found.append({"text": source_text, "link": None})
 
             formatted.append(f"{header}\n{doc}")
 
-        # Store sources for retrieval
-        self.last_sources = sources
+        # Hand sources to the caller's list rather than keeping them on the
+        # tool, which is shared by concurrent queries
+        if sources is not None:
+            sources.extend(found)
 
         return "\n\n".join(formatted)
 
@@ -221,6 +233,7 @@ class ToolManager:
 
     def __init__(self):
         self.tools = {}
+        self._tool_definitions: Optional[list] = None  # Built on first request
 
     def register_tool(self, tool: Tool):
         """Register any tool that implements the Tool interface"""
@@ -229,28 +242,36 @@ class ToolManager:
         if not tool_name:
             raise ValueError("Tool must have a 'name' in its definition")
         self.tools[tool_name] = tool
+        self._tool_definitions = None
 
     def get_tool_definitions(self) -> list:
         """Get all tool definitions for Anthropic tool calling"""
-        return [tool.get_tool_definition() for tool in self.tools.values()]
+        # Definitions are static, so build the list once and return the same
+        # object until another tool is registered
+        if self._tool_definitions is None:
+            self._tool_definitions = [
+                tool.get_tool_definition() for tool in self.tools.values()
+            ]
+        return self._tool_definitions
+
+    def execute_tool(
+        self, tool_name: str, sources: Optional[list] = None, **kwargs
+    ) -> str:
+        """
+        Execute a tool by name with given parameters.
+
+        Args:
+            tool_name: Name of the registered tool
+            sources: Per-query list that source-tracking tools append to
+            **kwargs: Tool input
 
-    def execute_tool(self, tool_name: str, **kwargs) -> str:
-        """Execute a tool by name with given parameters"""
+        Returns:
+            Tool output or an error message
+        """
         if tool_name not in self.tools:
             return f"Tool '{tool_name}' not found"
 
-        return self.tools[tool_name].execute(**kwargs)
-
-    def get_last_sources(self) -> list:
-        """Get sources from the last search operation"""
-        # Check all tools for last_sources attribute
-        for tool in self.tools.values():
-            if hasattr(tool, "last_sources") and tool.last_sources:
-                return tool.last_sources
-        return []
-
-    def reset_sources(self):
-        """Reset sources from all tools that track sources"""
-        for tool in self.tools.values():
-            if hasattr(tool, "last_sources"):
-                tool.last_sources = []
+        tool = self.tools[tool_name]
+        if tool.tracks_sources:
+            return tool.execute(sources=sources, **kwargs)
+        return tool.execute(**kwargs)
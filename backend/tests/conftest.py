@@ -1,23 +1,24 @@
+import asyncio
 import os
-import sys
 import tempfile
+from types import MappingProxyType, SimpleNamespace
 from typing import AsyncGenerator
-from unittest.mock import MagicMock, Mock, patch
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
 
 import pytest
-from fastapi.testclient import TestClient
+import pytest_asyncio
+from anthropic import AsyncAnthropic
+from anthropic.resources import AsyncMessages
 from httpx import AsyncClient
 
-# Add backend directory to Python path so we can import modules
-backend_path = os.path.dirname(os.path.abspath(__file__)).replace("/tests", "")
-sys.path.insert(0, backend_path)
-
+from ai_generator import AIGenerator
 from config import Config
 from models import Course, CourseChunk, Lesson
+from rag_system import RAGSystem
 from vector_store import SearchResults
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def mock_config():
     """Mock configuration for tests"""
     config = Mock(spec=Config)
@@ -28,11 +29,13 @@ def mock_config():
     config.CHUNK_OVERLAP = 100
     config.MAX_RESULTS = 5
     config.MAX_HISTORY = 2
+    config.RESPONSE_CACHE_THRESHOLD = 0.90
+    config.RESPONSE_CACHE_TTL = 3600.0
     config.CHROMA_PATH = "./test_chroma_db"
     return config
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_course():
     """Sample course for testing"""
     return Course(
@@ -59,10 +62,10 @@ def sample_course():
     )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_course_chunks(sample_course):
-    """Sample course chunks for testing"""
-    return [
+    """Sample course chunks for testing, as a tuple since the session shares them"""
+    return (
         CourseChunk(
             content="Machine learning is a method of data analysis that automates analytical model building.",
             course_title=sample_course.title,
@@ -81,10 +84,10 @@ def sample_course_chunks(sample_course):
             lesson_number=2,
             chunk_index=2,
         ),
-    ]
+    )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_search_results():
     """Sample search results for testing"""
     return SearchResults(
@@ -100,13 +103,13 @@ def sample_search_results():
     )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def empty_search_results():
     """Empty search results for testing"""
     return SearchResults(documents=[], metadata=[], distances=[])
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def error_search_results():
     """Error search results for testing"""
     return SearchResults.empty("Search error occurred")
@@ -129,42 +132,127 @@ def mock_vector_store():
 @pytest.fixture
 def mock_anthropic_client():
     """Mock Anthropic client for testing"""
-    mock_client = Mock()
-    mock_response = Mock()
-    mock_response.content = [Mock(text="Test response")]
-    mock_response.stop_reason = "end_turn"
-    mock_client.messages.create.return_value = mock_response
+    # Only the client boundary needs call tracking; responses are plain stubs.
+    # Specs limit the client to the real SDK surface, so a misspelled
+    # attribute fails instead of silently returning a child mock. The class
+    # is bound at import time, before _anthropic_patch replaces it
+    mock_client = Mock(spec=AsyncAnthropic)
+    mock_client.messages = Mock(spec=AsyncMessages)
+    mock_response = SimpleNamespace(
+        content=[SimpleNamespace(type="text", text="Test response")],
+        stop_reason="end_turn",
+    )
+    mock_client.messages.create = AsyncMock(return_value=mock_response)
+    mock_client.close = AsyncMock()
     return mock_client
 
 
-@pytest.fixture
-def mock_tool_use_response():
-    """Mock tool use response from Anthropic"""
-    mock_response = Mock()
-    mock_response.stop_reason = "tool_use"
+def _tool_block(name, tool_input, tool_id):
+    """Build a tool_use content block stub"""
+    return SimpleNamespace(type="tool_use", name=name, input=tool_input, id=tool_id)
+
+
+def _tool_response(blocks):
+    """Build a response stub that requests the given tool calls"""
+    # Tuple content keeps session-scoped stubs from being mutated by a test
+    return SimpleNamespace(stop_reason="tool_use", content=tuple(blocks))
+
+
+def _text_response(text):
+    """Build a final response stub with a single text block"""
+    return SimpleNamespace(
+        stop_reason="end_turn", content=(SimpleNamespace(type="text", text=text),)
+    )
 
-    # Mock tool use content block
-    mock_tool_block = Mock()
-    mock_tool_block.type = "tool_use"
-    mock_tool_block.name = "search_course_content"
-    mock_tool_block.input = {"query": "test query"}
-    mock_tool_block.id = "tool_use_123"
 
-    mock_response.content = [mock_tool_block]
-    return mock_response
+@pytest.fixture(scope="session")
+def make_tool_block():
+    """Factory for tool_use content block stubs"""
+    return _tool_block
+
+
+@pytest.fixture(scope="session")
+def make_tool_response():
+    """Factory for tool use response stubs"""
+    return _tool_response
+
+
+@pytest.fixture(scope="session")
+def make_text_response():
+    """Factory for final text response stubs"""
+    return _text_response
 
 
 @pytest.fixture
+def queue_responses(mock_anthropic_client):
+    """Queue responses for successive messages.create calls"""
+
+    def queue(*responses):
+        mock_anthropic_client.messages.create.side_effect = iter(responses)
+
+    return queue
+
+
+@pytest.fixture(scope="session")
+def _anthropic_patch():
+    """Patch the Anthropic and HTTP client classes once for the whole session"""
+    with (
+        patch("ai_generator.anthropic.AsyncAnthropic") as mock_anthropic,
+        patch("ai_generator.anthropic.DefaultAsyncHttpxClient"),
+    ):
+        # Generators built before a test installs its own client still close
+        mock_anthropic.return_value.close = AsyncMock()
+        yield mock_anthropic
+
+
+@pytest_asyncio.fixture
+async def ai_generator(_anthropic_patch, mock_anthropic_client):
+    """AIGenerator wired to the mock Anthropic client"""
+    _anthropic_patch.return_value = mock_anthropic_client
+    generator = AIGenerator("test_key", "claude-sonnet-4-20250514")
+    yield generator
+    await generator.close()
+
+
+@pytest_asyncio.fixture(scope="module", loop_scope="module")
+async def ai_generator_readonly(_anthropic_patch):
+    """AIGenerator shared by tests that only read its attributes or helpers"""
+    generator = AIGenerator("test_key", "claude-sonnet-4-20250514")
+    yield generator
+    await generator.close()
+
+
+@pytest.fixture(scope="session")
+def mock_tool_use_response():
+    """Mock tool use response from Anthropic"""
+    return _tool_response(
+        [_tool_block("search_course_content", {"query": "test query"}, "tool_use_123")]
+    )
+
+
+@pytest.fixture(scope="session")
 def mock_final_response():
     """Mock final response after tool execution"""
-    mock_response = Mock()
-    mock_response.content = [Mock(text="Here's what I found about test query...")]
-    return mock_response
+    return _text_response("Here's what I found about test query...")
+
+
+@pytest.fixture(scope="session")
+def tool_round_params():
+    """Read-only request parameters passed to _handle_tool_execution"""
+    return MappingProxyType(
+        {
+            "messages": ({"role": "user", "content": "Test query"},),
+            "system": "Test system prompt",
+            "model": "test_model",
+            "temperature": 0,
+            "max_tokens": 800,
+        }
+    )
 
 
 # API Testing Fixtures
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def temp_frontend_dir():
     """Create a temporary frontend directory for testing"""
     with tempfile.TemporaryDirectory() as temp_dir:
@@ -179,11 +267,12 @@ def temp_frontend_dir():
         yield frontend_path
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_app(temp_frontend_dir):
     """Create a test FastAPI app instance"""
     from fastapi import FastAPI, HTTPException
     from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import ORJSONResponse
     from fastapi.staticfiles import StaticFiles
     from pydantic import BaseModel
     from typing import List, Optional, Union, Dict, Any
@@ -206,7 +295,7 @@ def test_app(temp_frontend_dir):
         course_titles: List[str]
     
     # Create test app without mounting problematic static files in production
-    test_app = FastAPI(title="Test RAG System")
+    test_app = FastAPI(title="Test RAG System", default_response_class=ORJSONResponse)
     
     # Add CORS middleware
     test_app.add_middleware(
@@ -217,15 +306,16 @@ def test_app(temp_frontend_dir):
         allow_headers=["*"],
     )
     
-    # Mock RAG system for testing
-    mock_rag_system = Mock()
+    # Mock RAG system for testing; specced once per session, so a call to a
+    # method RAGSystem doesn't have fails, and async query gets an AsyncMock
+    mock_rag_system = Mock(spec=RAGSystem)
     
     @test_app.post("/api/query", response_model=QueryResponse)
     async def query_documents(request: QueryRequest):
         """Test endpoint for document queries"""
         try:
             session_id = request.session_id or "test_session"
-            answer, sources = mock_rag_system.query(request.query, session_id)
+            answer, sources = await mock_rag_system.query(request.query, session_id)
             
             return QueryResponse(
                 answer=answer,
@@ -258,15 +348,18 @@ def test_app(temp_frontend_dir):
     return test_app
 
 
-@pytest.fixture
-def test_client(test_app):
-    """Create a test client for synchronous testing"""
-    return TestClient(test_app)
+def pytest_asyncio_loop_factories(config, item):
+    """Run async tests on uvloop where it is available"""
+    try:
+        import uvloop
+    except ImportError:
+        return {"asyncio": asyncio.new_event_loop}
+    return {"uvloop": uvloop.new_event_loop}
 
 
-@pytest.fixture
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
 async def async_test_client(test_app) -> AsyncGenerator[AsyncClient, None]:
-    """Create an async test client for async testing"""
+    """Create an async test client for async testing, shared across the session"""
     from httpx import ASGITransport
     transport = ASGITransport(app=test_app)
     async with AsyncClient(transport=transport, base_url="http://test") as client:
@@ -275,11 +368,15 @@ async def async_test_client(test_app) -> AsyncGenerator[AsyncClient, None]:
 
 @pytest.fixture
 def mock_rag_system(test_app):
-    """Access the mock RAG system from the test app"""
-    return test_app.state.mock_rag_system
+    """Access the mock RAG system from the test app, reset for this test"""
+    # The app is shared across the session, so clear call history and any
+    # return values or side effects configured by earlier tests
+    mock = test_app.state.mock_rag_system
+    mock.reset_mock(return_value=True, side_effect=True)
+    return mock
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_query_request():
     """Sample query request for testing"""
     return {
@@ -288,7 +385,7 @@ def sample_query_request():
     }
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_query_response():
     """Sample query response for testing"""
     return {
@@ -301,7 +398,7 @@ def sample_query_response():
     }
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_course_analytics():
     """Sample course analytics for testing"""
     return {
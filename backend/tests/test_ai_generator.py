@@ -1,51 +1,80 @@
-import os
-import sys
-from unittest.mock import MagicMock, Mock, patch
+import asyncio
+import threading
+from types import MappingProxyType
+from unittest.mock import ANY, AsyncMock, MagicMock, Mock, call
 
 import pytest
-
-# Add backend directory to Python path
-backend_path = os.path.dirname(os.path.abspath(__file__)).replace("/tests", "")
-sys.path.insert(0, backend_path)
-
 from ai_generator import AIGenerator
+from search_tools import CourseSearchTool, ToolManager
+from vector_store import SearchResults
+
+# Read-only tool definitions shared by every test; a test that mutated them
+# would fail instead of leaking state into later tests
+TOOLS = (
+    MappingProxyType(
+        {"name": "search_course_content", "description": "Search courses"}
+    ),
+)
 
 
 class TestAIGenerator:
     """Test suite for AIGenerator tool calling functionality"""
 
-    @pytest.fixture
-    def ai_generator(self, mock_anthropic_client):
-        """Create AIGenerator instance with mocked client"""
-        with patch(
-            "ai_generator.anthropic.Anthropic", return_value=mock_anthropic_client
-        ):
-            generator = AIGenerator("test_key", "claude-sonnet-4-20250514")
-            generator.client = mock_anthropic_client
-            return generator
-
-    def test_init_parameters(self):
+    def test_init_parameters(self, _anthropic_patch, monkeypatch):
         """Test AIGenerator initialization with correct parameters"""
-        with patch("ai_generator.anthropic.Anthropic") as mock_anthropic:
-            generator = AIGenerator("test_api_key", "test_model")
+        mock_anthropic = MagicMock()
+        monkeypatch.setattr("ai_generator.anthropic.AsyncAnthropic", mock_anthropic)
 
-            mock_anthropic.assert_called_once_with(api_key="test_api_key")
-            assert generator.model == "test_model"
-            assert generator.base_params["model"] == "test_model"
-            assert generator.base_params["temperature"] == 0
-            assert generator.base_params["max_tokens"] == 800
+        generator = AIGenerator("test_api_key", "test_model")
+
+        mock_anthropic.assert_called_once_with(
+            api_key="test_api_key", timeout=30.0, http_client=ANY
+        )
+        assert generator.model == "test_model"
+        assert generator.base_params["model"] == "test_model"
+        assert generator.base_params["temperature"] == 0
+        assert generator.base_params["max_tokens"] == 800
+
+    def test_init_uses_http2_client(self, monkeypatch):
+        """Test AIGenerator gives the client a keep-alive HTTP/2 connection pool"""
+        mock_anthropic = MagicMock()
+        mock_http = MagicMock()
+        monkeypatch.setattr("ai_generator.anthropic.AsyncAnthropic", mock_anthropic)
+        monkeypatch.setattr("ai_generator.anthropic.DefaultAsyncHttpxClient", mock_http)
+
+        AIGenerator("test_api_key", "test_model")
+
+        assert mock_http.call_args.kwargs["http2"] is True
+        limits = mock_http.call_args.kwargs["limits"]
+        assert limits.max_keepalive_connections == 20
+        assert limits.keepalive_expiry == 120
+        http_client = mock_anthropic.call_args.kwargs["http_client"]
+        assert http_client is mock_http.return_value
+
+    def test_init_custom_timeout(self, _anthropic_patch, monkeypatch):
+        """Test AIGenerator passes a custom request timeout to the client"""
+        mock_anthropic = MagicMock()
+        monkeypatch.setattr("ai_generator.anthropic.AsyncAnthropic", mock_anthropic)
+
+        AIGenerator("test_api_key", "test_model", timeout=5.0)
+
+        mock_anthropic.assert_called_once_with(
+            api_key="test_api_key", timeout=5.0, http_client=ANY
+        )
 
-    def test_generate_response_without_tools(self, ai_generator, mock_anthropic_client):
+    async def test_generate_response_without_tools(
+        self, ai_generator, mock_anthropic_client
+    ):
         """Test generate_response without tools - direct response"""
         mock_response = Mock()
         mock_response.content = [Mock(text="Direct response without tools")]
         mock_response.stop_reason = "end_turn"
         mock_anthropic_client.messages.create.return_value = mock_response
 
-        result = ai_generator.generate_response("What is machine learning?")
+        result = await ai_generator.generate_response("What is machine learning?")
 
         # Verify API call parameters
-        call_args = mock_anthropic_client.messages.create.call_args[1]
+        call_args = mock_anthropic_client.messages.create.call_args.kwargs
         assert call_args["model"] == "claude-sonnet-4-20250514"
         assert call_args["temperature"] == 0
         assert call_args["max_tokens"] == 800
@@ -56,7 +85,7 @@ class TestAIGenerator:
 
         assert result == "Direct response without tools"
 
-    def test_generate_response_with_conversation_history(
+    async def test_generate_response_with_conversation_history(
         self, ai_generator, mock_anthropic_client
     ):
         """Test generate_response includes conversation history in system prompt"""
@@ -66,16 +95,18 @@ class TestAIGenerator:
         mock_anthropic_client.messages.create.return_value = mock_response
 
         history = "Previous conversation context here"
-        result = ai_generator.generate_response(
+        result = await ai_generator.generate_response(
             "Follow up question", conversation_history=history
         )
 
-        # Verify system prompt includes history
-        call_args = mock_anthropic_client.messages.create.call_args[1]
-        assert history in call_args["system"]
-        assert "Previous conversation:" in call_args["system"]
+        # Verify history follows the static prompt as its own block
+        call_args = mock_anthropic_client.messages.create.call_args.kwargs
+        static_block, history_block = call_args["system"]
+        assert static_block["text"] == ai_generator.SYSTEM_PROMPT
+        assert history in history_block["text"]
+        assert "Previous conversation:" in history_block["text"]
 
-    def test_generate_response_with_tools_no_tool_use(
+    async def test_generate_response_with_tools_no_tool_use(
         self, ai_generator, mock_anthropic_client
     ):
         """Test generate_response with tools provided but AI doesn't use them"""
@@ -84,16 +115,15 @@ class TestAIGenerator:
         mock_response.stop_reason = "end_turn"
         mock_anthropic_client.messages.create.return_value = mock_response
 
-        tools = [{"name": "search_course_content", "description": "Search courses"}]
         mock_tool_manager = Mock()
 
-        result = ai_generator.generate_response(
-            "General question", tools=tools, tool_manager=mock_tool_manager
+        result = await ai_generator.generate_response(
+            "General question", tools=TOOLS, tool_manager=mock_tool_manager
         )
 
         # Verify tools were provided to API
-        call_args = mock_anthropic_client.messages.create.call_args[1]
-        assert call_args["tools"] == tools
+        call_args = mock_anthropic_client.messages.create.call_args.kwargs
+        assert call_args["tools"] == TOOLS
         assert call_args["tool_choice"] == {"type": "auto"}
 
         # Tool manager should not be called
@@ -101,31 +131,31 @@ class TestAIGenerator:
 
         assert result == "Direct response, no tools needed"
 
-    def test_generate_response_with_tool_use(
+    async def test_generate_response_with_tool_use(
         self,
         ai_generator,
         mock_anthropic_client,
         mock_tool_use_response,
         mock_final_response,
+        queue_responses,
     ):
         """Test generate_response when AI uses tools"""
         # First call returns tool use, second call returns final response
-        mock_anthropic_client.messages.create.side_effect = [
+        queue_responses(
             mock_tool_use_response,
             mock_final_response,
-        ]
+        )
 
-        tools = [{"name": "search_course_content", "description": "Search courses"}]
         mock_tool_manager = Mock()
         mock_tool_manager.execute_tool.return_value = "Search results content"
 
-        result = ai_generator.generate_response(
-            "Search for machine learning", tools=tools, tool_manager=mock_tool_manager
+        result = await ai_generator.generate_response(
+            "Search for machine learning", tools=TOOLS, tool_manager=mock_tool_manager
         )
 
         # Verify tool was executed
         mock_tool_manager.execute_tool.assert_called_once_with(
-            "search_course_content", query="test query"
+            "search_course_content", sources=None, query="test query"
         )
 
         # Verify two API calls were made
@@ -134,38 +164,33 @@ class TestAIGenerator:
         # Verify final response
         assert result == "Here's what I found about test query..."
 
-    def test_handle_tool_execution_single_tool(
+    async def test_handle_tool_execution_single_tool(
         self,
         ai_generator,
         mock_anthropic_client,
         mock_tool_use_response,
         mock_final_response,
+        tool_round_params,
     ):
         """Test _handle_tool_execution with single tool call"""
         mock_tool_manager = Mock()
         mock_tool_manager.execute_tool.return_value = "Tool execution result"
 
-        base_params = {
-            "messages": [{"role": "user", "content": "Test query"}],
-            "system": "Test system prompt",
-            "model": "test_model",
-            "temperature": 0,
-            "max_tokens": 800,
-        }
+        base_params = tool_round_params
 
         mock_anthropic_client.messages.create.return_value = mock_final_response
 
-        result = ai_generator._handle_tool_execution(
+        result = await ai_generator._handle_tool_execution(
             mock_tool_use_response, base_params, mock_tool_manager
         )
 
         # Verify tool execution
         mock_tool_manager.execute_tool.assert_called_once_with(
-            "search_course_content", query="test query"
+            "search_course_content", sources=None, query="test query"
         )
 
         # Verify final API call structure
-        final_call_args = mock_anthropic_client.messages.create.call_args[1]
+        final_call_args = mock_anthropic_client.messages.create.call_args.kwargs
         assert (
             len(final_call_args["messages"]) == 3
         )  # original + assistant + tool results
@@ -180,63 +205,159 @@ class TestAIGenerator:
 
         assert result == "Here's what I found about test query..."
 
-    def test_handle_tool_execution_multiple_tools(
-        self, ai_generator, mock_anthropic_client, mock_final_response
+    async def test_handle_tool_execution_multiple_tools(
+        self,
+        ai_generator,
+        mock_anthropic_client,
+        mock_final_response,
+        make_tool_block,
+        make_tool_response,
+        tool_round_params,
     ):
         """Test _handle_tool_execution with multiple tool calls"""
         # Create response with multiple tool uses
-        mock_tool_block_1 = Mock()
-        mock_tool_block_1.type = "tool_use"
-        mock_tool_block_1.name = "search_course_content"
-        mock_tool_block_1.input = {"query": "test query 1"}
-        mock_tool_block_1.id = "tool_use_123"
-
-        mock_tool_block_2 = Mock()
-        mock_tool_block_2.type = "tool_use"
-        mock_tool_block_2.name = "get_course_outline"
-        mock_tool_block_2.input = {"course_name": "Test Course"}
-        mock_tool_block_2.id = "tool_use_456"
-
-        mock_response = Mock()
-        mock_response.stop_reason = "tool_use"  # Add missing stop_reason
-        mock_response.content = [mock_tool_block_1, mock_tool_block_2]
+        mock_response = make_tool_response(
+            [
+                make_tool_block(
+                    "search_course_content", {"query": "test query 1"}, "tool_use_123"
+                ),
+                make_tool_block(
+                    "get_course_outline", {"course_name": "Test Course"}, "tool_use_456"
+                ),
+            ]
+        )
 
         mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = ["Result 1", "Result 2"]
+        # Tools in a round run concurrently, so key results by tool name
+        tool_outputs = {
+            "search_course_content": "Result 1",
+            "get_course_outline": "Result 2",
+        }
+        mock_tool_manager.execute_tool.side_effect = (
+            lambda name, **kwargs: tool_outputs[name]
+        )
 
         base_params = {
-            "messages": [{"role": "user", "content": "Test query"}],
-            "system": "Test system prompt",
-            "model": "test_model",
-            "temperature": 0,
-            "max_tokens": 800,
-            "tools": [{"name": "search_course_content"}],  # Add tools to base_params
+            **tool_round_params,
+            "tools": [{"name": "search_course_content"}],
         }
 
         mock_anthropic_client.messages.create.return_value = mock_final_response
 
-        result = ai_generator._handle_tool_execution(
+        result = await ai_generator._handle_tool_execution(
             mock_response, base_params, mock_tool_manager
         )
 
-        # Verify both tools were executed
-        assert mock_tool_manager.execute_tool.call_count == 2
-        mock_tool_manager.execute_tool.assert_any_call(
-            "search_course_content", query="test query 1"
-        )
-        mock_tool_manager.execute_tool.assert_any_call(
-            "get_course_outline", course_name="Test Course"
-        )
+        # Verify both tools were executed; they run concurrently, so calls
+        # are compared in tool-name order
+        calls = mock_tool_manager.execute_tool.call_args_list
+        assert sorted(calls, key=lambda c: c.args[0]) == [
+            call("get_course_outline", sources=None, course_name="Test Course"),
+            call("search_course_content", sources=None, query="test query 1"),
+        ]
 
         # Verify tool results structure
-        final_call_args = mock_anthropic_client.messages.create.call_args[1]
+        final_call_args = mock_anthropic_client.messages.create.call_args.kwargs
         tool_results = final_call_args["messages"][2]["content"]
         assert len(tool_results) == 2
         assert tool_results[0]["content"] == "Result 1"
         assert tool_results[1]["content"] == "Result 2"
 
-    def test_handle_tool_execution_no_tool_blocks(
-        self, ai_generator, mock_anthropic_client, mock_final_response
+    async def test_handle_tool_execution_runs_round_concurrently(
+        self,
+        ai_generator,
+        mock_anthropic_client,
+        mock_final_response,
+        make_tool_block,
+        make_tool_response,
+        tool_round_params,
+    ):
+        """Test that tool calls within one round execute concurrently"""
+        mock_response = make_tool_response(
+            [
+                make_tool_block("search_course_content", {"query": tool_id}, tool_id)
+                for tool_id in ("tool_1", "tool_2")
+            ]
+        )
+
+        # Each call blocks until both are in flight; sequential execution
+        # would break the barrier and surface as a tool error
+        barrier = threading.Barrier(2, timeout=5)
+
+        def execute_tool(name, **kwargs):
+            barrier.wait()
+            return f"Result for {kwargs['query']}"
+
+        mock_tool_manager = Mock()
+        mock_tool_manager.execute_tool.side_effect = execute_tool
+        mock_anthropic_client.messages.create.return_value = mock_final_response
+
+        base_params = tool_round_params
+
+        await ai_generator._handle_tool_execution(
+            mock_response, base_params, mock_tool_manager
+        )
+
+        final_call_args = mock_anthropic_client.messages.create.call_args.kwargs
+        tool_results = final_call_args["messages"][2]["content"]
+        assert [r["tool_use_id"] for r in tool_results] == ["tool_1", "tool_2"]
+        assert [r["content"] for r in tool_results] == [
+            "Result for tool_1",
+            "Result for tool_2",
+        ]
+
+    async def test_concurrent_queries_keep_their_own_sources(
+        self,
+        ai_generator,
+        mock_anthropic_client,
+        mock_vector_store,
+        make_tool_block,
+        make_tool_response,
+        make_text_response,
+    ):
+        """Test that concurrent queries sharing a ToolManager get only their sources"""
+        tool_manager = ToolManager()
+        tool_manager.register_tool(CourseSearchTool(mock_vector_store))
+        mock_vector_store.search.side_effect = lambda query, **filters: SearchResults(
+            documents=[f"{query} content"],
+            metadata=[{"course_title": query, "lesson_number": 1}],
+            distances=[0.1],
+        )
+
+        async def create(**params):
+            # Yield first so the two queries interleave at every API call
+            await asyncio.sleep(0)
+            query = params["messages"][0]["content"]
+            if len(params["messages"]) == 1:
+                return make_tool_response(
+                    [make_tool_block("search_course_content", {"query": query}, query)]
+                )
+            return make_text_response(f"Answer {query}")
+
+        mock_anthropic_client.messages.create.side_effect = create
+
+        sources = {"A": [], "B": []}
+        await asyncio.gather(
+            *(
+                ai_generator.generate_response(
+                    query,
+                    tools=tool_manager.get_tool_definitions(),
+                    tool_manager=tool_manager,
+                    sources=sources[query],
+                )
+                for query in sources
+            )
+        )
+
+        assert [s["text"] for s in sources["A"]] == ["A - Lesson 1"]
+        assert [s["text"] for s in sources["B"]] == ["B - Lesson 1"]
+
+    async def test_handle_tool_execution_no_tool_blocks(
+        self,
+        ai_generator,
+        mock_anthropic_client,
+        mock_final_response,
+        tool_round_params,
     ):
         """Test _handle_tool_execution when response has no tool_use blocks"""
         mock_response = Mock()
@@ -247,16 +368,10 @@ class TestAIGenerator:
         mock_response.content = [mock_text_content]
 
         mock_tool_manager = Mock()
-        base_params = {
-            "messages": [{"role": "user", "content": "Test query"}],
-            "system": "Test system prompt",
-            "model": "test_model",
-            "temperature": 0,
-            "max_tokens": 800,
-        }
+        base_params = tool_round_params
 
         # Should not make any API calls since there are no tools to execute
-        result = ai_generator._handle_tool_execution(
+        result = await ai_generator._handle_tool_execution(
             mock_response, base_params, mock_tool_manager
         )
 
@@ -269,274 +384,357 @@ class TestAIGenerator:
         # Should return the response text directly
         assert result == "No tools here"
 
-    def test_generate_response_tool_execution_error_handling(
+    async def test_handle_tool_execution_tool_use_without_blocks(
+        self, ai_generator, mock_anthropic_client, tool_round_params
+    ):
+        """Test that a tool_use stop with no tool_use blocks makes no API call"""
+        mock_text_content = Mock()
+        mock_text_content.type = "text"
+        mock_text_content.text = "Partial answer"
+
+        mock_response = Mock()
+        mock_response.stop_reason = "tool_use"
+        mock_response.content = [mock_text_content]
+
+        mock_tool_manager = Mock()
+        base_params = tool_round_params
+
+        result = await ai_generator._handle_tool_execution(
+            mock_response, base_params, mock_tool_manager
+        )
+
+        mock_tool_manager.execute_tool.assert_not_called()
+        mock_anthropic_client.messages.create.assert_not_called()
+        assert result == "Partial answer"
+
+    async def test_generate_response_tool_execution_error_handling(
         self,
         ai_generator,
         mock_anthropic_client,
         mock_tool_use_response,
         mock_final_response,
+        queue_responses,
     ):
         """Test error handling during tool execution"""
-        tools = [{"name": "search_course_content", "description": "Search courses"}]
         mock_tool_manager = Mock()
         mock_tool_manager.execute_tool.side_effect = Exception("Tool execution failed")
 
-        mock_anthropic_client.messages.create.side_effect = [
+        queue_responses(
             mock_tool_use_response,
             mock_final_response,
-        ]
+        )
 
         # This should not crash, but handle the exception gracefully
-        result = ai_generator.generate_response(
-            "Search query", tools=tools, tool_manager=mock_tool_manager
+        result = await ai_generator.generate_response(
+            "Search query", tools=TOOLS, tool_manager=mock_tool_manager
         )
 
         # Should still attempt to make final call even if tool execution fails
-        assert mock_anthropic_client.messages.create.call_count == 2
+        calls = mock_anthropic_client.messages.create.call_args_list
+        assert len(calls) == 2
 
         # Verify error message was included in tool results
-        call_args = mock_anthropic_client.messages.create.call_args_list[1][1]
-        tool_result_content = call_args["messages"][-1]["content"][0]["content"]
+        tool_result_content = calls[1].kwargs["messages"][-1]["content"][0]["content"]
         assert "Error executing tool: Tool execution failed" in tool_result_content
 
-    def test_sequential_tool_calling_two_rounds(
+    async def test_generate_response_cache_hit(
         self, ai_generator, mock_anthropic_client
     ):
-        """Test sequential tool calling across 2 rounds"""
-        tools = [{"name": "search_course_content", "description": "Search courses"}]
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = [
-            "Round 1 result",
-            "Round 2 result",
-        ]
+        """Test that a cached answer is returned without calling Claude"""
+        mock_cache = Mock()
+        mock_cache.get.return_value = "Cached answer"
+        ai_generator.response_cache = mock_cache
 
-        # First call: tool use response
-        mock_tool_response_1 = Mock()
-        mock_tool_response_1.stop_reason = "tool_use"
-        mock_tool_block_1 = Mock()
-        mock_tool_block_1.type = "tool_use"
-        mock_tool_block_1.name = "search_course_content"
-        mock_tool_block_1.input = {"query": "first search"}
-        mock_tool_block_1.id = "tool_1"
-        mock_tool_response_1.content = [mock_tool_block_1]
-
-        # Second call: another tool use response
-        mock_tool_response_2 = Mock()
-        mock_tool_response_2.stop_reason = "tool_use"
-        mock_tool_block_2 = Mock()
-        mock_tool_block_2.type = "tool_use"
-        mock_tool_block_2.name = "search_course_content"
-        mock_tool_block_2.input = {"query": "second search"}
-        mock_tool_block_2.id = "tool_2"
-        mock_tool_response_2.content = [mock_tool_block_2]
-
-        # Third call: final response
-        mock_final_response = Mock()
-        mock_final_response.stop_reason = "end_turn"
-        mock_final_response.content = [Mock(text="Final synthesized answer")]
-
-        mock_anthropic_client.messages.create.side_effect = [
-            mock_tool_response_1,
-            mock_tool_response_2,
-            mock_final_response,
-        ]
-
-        result = ai_generator.generate_response(
-            "Complex query", tools=tools, tool_manager=mock_tool_manager
+        result = await ai_generator.generate_response(
+            "Wrapped prompt", cache_key="What is ML?"
         )
 
-        # Verify 3 API calls were made (initial + 2 rounds)
-        assert mock_anthropic_client.messages.create.call_count == 3
+        mock_cache.get.assert_called_once_with("What is ML?")
+        mock_anthropic_client.messages.create.assert_not_called()
+        assert result == "Cached answer"
 
-        # Verify both tools were executed
-        assert mock_tool_manager.execute_tool.call_count == 2
-        mock_tool_manager.execute_tool.assert_any_call(
-            "search_course_content", query="first search"
-        )
-        mock_tool_manager.execute_tool.assert_any_call(
-            "search_course_content", query="second search"
+    async def test_generate_response_cache_miss_stores_answer(
+        self, ai_generator, mock_anthropic_client
+    ):
+        """Test that a direct answer is written back on cache miss"""
+        mock_cache = Mock()
+        mock_cache.get.return_value = None
+        ai_generator.response_cache = mock_cache
+
+        result = await ai_generator.generate_response(
+            "Wrapped prompt", cache_key="What is ML?"
         )
 
-        # Verify final result
-        assert result == "Final synthesized answer"
+        mock_anthropic_client.messages.create.assert_called_once()
+        await asyncio.gather(*ai_generator._pending_writes)
+        mock_cache.set.assert_called_once_with("What is ML?", "Test response")
+        assert result == "Test response"
 
-    def test_sequential_tool_calling_early_termination(
+    async def test_generate_response_cache_write_does_not_delay_answer(
         self, ai_generator, mock_anthropic_client
     ):
-        """Test that sequential tool calling terminates early when no more tools needed"""
-        tools = [{"name": "search_course_content", "description": "Search courses"}]
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Search result"
-
-        # First call: tool use response
-        mock_tool_response = Mock()
-        mock_tool_response.stop_reason = "tool_use"
-        mock_tool_block = Mock()
-        mock_tool_block.type = "tool_use"
-        mock_tool_block.name = "search_course_content"
-        mock_tool_block.input = {"query": "search"}
-        mock_tool_block.id = "tool_1"
-        mock_tool_response.content = [mock_tool_block]
-
-        # Second call: final response (no more tools)
-        mock_final_response = Mock()
-        mock_final_response.stop_reason = "end_turn"
-        mock_final_response.content = [Mock(text="Complete answer")]
-
-        mock_anthropic_client.messages.create.side_effect = [
-            mock_tool_response,
-            mock_final_response,
-        ]
-
-        result = ai_generator.generate_response(
-            "Simple query", tools=tools, tool_manager=mock_tool_manager
+        """Test that the answer is returned before the cache write finishes"""
+        release = threading.Event()
+        mock_cache = Mock()
+        mock_cache.get.return_value = None
+        mock_cache.set.side_effect = lambda *args: release.wait(5)
+        ai_generator.response_cache = mock_cache
+
+        result = await ai_generator.generate_response(
+            "Wrapped prompt", cache_key="What is ML?"
         )
 
-        # Should only make 2 API calls (not 3)
-        assert mock_anthropic_client.messages.create.call_count == 2
-
-        # Should only execute 1 tool
-        assert mock_tool_manager.execute_tool.call_count == 1
+        # The write is still blocked, yet the answer is already back
+        assert result == "Test response"
+        (write,) = ai_generator._pending_writes
+        assert not write.done()
 
-        assert result == "Complete answer"
+        release.set()
+        await write
+        assert not ai_generator._pending_writes
 
-    def test_sequential_tool_calling_max_rounds_limit(
-        self, ai_generator, mock_anthropic_client
+    async def test_generate_response_cache_skips_tool_answers(
+        self,
+        ai_generator,
+        mock_anthropic_client,
+        mock_tool_use_response,
+        mock_final_response,
+        queue_responses,
     ):
-        """Test that sequential tool calling respects max rounds limit"""
-        tools = [{"name": "search_course_content", "description": "Search courses"}]
+        """Test that answers produced with tools are not cached"""
+        mock_cache = Mock()
+        mock_cache.get.return_value = None
+        ai_generator.response_cache = mock_cache
+        queue_responses(
+            mock_tool_use_response,
+            mock_final_response,
+        )
         mock_tool_manager = Mock()
         mock_tool_manager.execute_tool.return_value = "Search result"
 
-        # Create tool use responses for 3 potential rounds (should stop at 2)
-        def create_tool_response(tool_id):
-            mock_response = Mock()
-            mock_response.stop_reason = "tool_use"
-            mock_tool_block = Mock()
-            mock_tool_block.type = "tool_use"
-            mock_tool_block.name = "search_course_content"
-            mock_tool_block.input = {"query": f"search {tool_id}"}
-            mock_tool_block.id = tool_id
-            mock_response.content = [mock_tool_block]
-            return mock_response
-
-        # Final response without tools
-        mock_final_response = Mock()
-        mock_final_response.stop_reason = "end_turn"
-        mock_final_response.content = [Mock(text="Final answer")]
-
-        mock_anthropic_client.messages.create.side_effect = [
-            create_tool_response("tool_1"),
-            create_tool_response("tool_2"),
-            mock_final_response,  # This should be the final call
-        ]
-
-        result = ai_generator.generate_response(
-            "Complex multi-step query", tools=tools, tool_manager=mock_tool_manager
+        await ai_generator.generate_response(
+            "Wrapped prompt",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=mock_tool_manager,
+            cache_key="What is in lesson 1?",
         )
 
-        # Should make exactly 3 API calls (initial + 2 tool rounds)
-        assert mock_anthropic_client.messages.create.call_count == 3
+        mock_cache.set.assert_not_called()
 
-        # Should execute exactly 2 tools (max rounds limit)
-        assert mock_tool_manager.execute_tool.call_count == 2
+    async def test_generate_response_cache_skipped_with_history(
+        self, ai_generator, mock_anthropic_client
+    ):
+        """Test that follow-up questions bypass the cache entirely"""
+        mock_cache = Mock()
+        ai_generator.response_cache = mock_cache
+
+        await ai_generator.generate_response(
+            "Wrapped prompt",
+            conversation_history="User: Hi",
+            cache_key="And lesson 2?",
+        )
 
-        # Verify final call doesn't include tools (reached max rounds)
-        final_call_args = mock_anthropic_client.messages.create.call_args_list[2][1]
-        assert "tools" not in final_call_args
+        mock_cache.get.assert_not_called()
+        mock_cache.set.assert_not_called()
+        mock_anthropic_client.messages.create.assert_called_once()
+
+    def test_tool_result_content(self, ai_generator_readonly):
+        """Test tool outcomes are converted to tool_result text"""
+        assert (
+            ai_generator_readonly._tool_result_content("Search results")
+            == "Search results"
+        )
+        assert (
+            ai_generator_readonly._tool_result_content(Exception("Tool failed"))
+            == "Error executing tool: Tool failed"
+        )
 
-        assert result == "Final answer"
+    def test_split_comparison(self, ai_generator_readonly):
+        """Test comparison subjects are extracted from supported phrasings"""
+        assert ai_generator_readonly._split_comparison(
+            "What is the difference between MCP and RAG?"
+        ) == ["MCP", "RAG"]
+        assert ai_generator_readonly._split_comparison(
+            "Compare the MCP course with the Chroma course"
+        ) == ["the MCP course", "the Chroma course"]
+        assert ai_generator_readonly._split_comparison("MCP vs RAG") == ["MCP", "RAG"]
+        # Shared nouns and qualifiers stay on one side only; subqueries carry
+        # the whole question so the research step still sees them
+        assert ai_generator_readonly._split_comparison(
+            "difference between supervised and unsupervised learning"
+        ) == ["supervised", "unsupervised learning"]
+        assert ai_generator_readonly._split_comparison(
+            "Python vs JavaScript for data science?"
+        ) == ["Python", "JavaScript for data science"]
+        assert ai_generator_readonly._split_comparison("What is MCP?") == []
+
+    @pytest.mark.parametrize(
+        "question",
+        [
+            "How does retrieval work in RAG vs fine-tuning, and which does lesson 3 recommend?",
+            "Can you compare notes with me and explain lesson 2?",
+            # Questions are split before the RAG prompt wrapping is applied
+            "Answer this question about course materials: MCP vs RAG",
+            # Pronouns refer back to earlier context, not to a topic
+            "Compare it with RAG",
+        ],
+        ids=["embedded_vs", "compare_verb", "wrapped_prompt", "pronoun"],
+    )
+    def test_split_comparison_ignores_non_comparisons(
+        self, ai_generator_readonly, question
+    ):
+        """Test comparison words inside a wider question are not split"""
+        assert ai_generator_readonly._split_comparison(question) == []
 
-    def test_handle_tool_execution_with_max_rounds_parameter(
+    async def test_generate_response_comparison_fanout(
         self, ai_generator, mock_anthropic_client
     ):
-        """Test _handle_tool_execution with custom max_rounds parameter"""
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Tool result"
+        """Test comparison queries research each subject, then synthesize"""
+
+        def respond(**kwargs):
+            content = kwargs["messages"][0]["content"]
+            response = Mock()
+            response.stop_reason = "end_turn"
+            response.content = [Mock(text=f"Answer for: {content}")]
+            return response
+
+        mock_anthropic_client.messages.create.side_effect = respond
+        tools = [{"name": "search_course_content"}]
+
+        # Called as RAGSystem.query does: wrapped prompt plus the raw question
+        question = "What is the difference between MCP and RAG?"
+        query = f"Answer this question about course materials: {question}"
+        result = await ai_generator.generate_response(
+            query, tools=tools, tool_manager=Mock(), cache_key=question
+        )
 
-        # Tool use response
-        mock_tool_response = Mock()
-        mock_tool_response.stop_reason = "tool_use"
-        mock_tool_block = Mock()
-        mock_tool_block.type = "tool_use"
-        mock_tool_block.name = "search_course_content"
-        mock_tool_block.input = {"query": "test"}
-        mock_tool_block.id = "tool_1"
-        mock_tool_response.content = [mock_tool_block]
+        calls = mock_anthropic_client.messages.create.call_args_list
+        assert len(calls) == 3
 
-        # Final response
-        mock_final_response = Mock()
-        mock_final_response.stop_reason = "end_turn"
-        mock_final_response.content = [Mock(text="Final answer")]
+        # Subqueries are offered tools; the synthesis call is not
+        subqueries = [c.kwargs["messages"][0]["content"] for c in calls[:2]]
+        assert subqueries == [
+            f"What do the course materials say about {subject}? "
+            f'This is one part of the question "{question}".'
+            for subject in ("MCP", "RAG")
+        ]
+        assert all("tools" in c.kwargs for c in calls[:2])
+        assert "tools" not in calls[2].kwargs
 
-        mock_anthropic_client.messages.create.side_effect = [mock_final_response]
+        synthesis = calls[2].kwargs["messages"][0]["content"]
+        assert synthesis.startswith(query)
+        assert f"Answer for: {subqueries[1]}" in synthesis
+        assert result == f"Answer for: {synthesis}"
 
-        base_params = {
-            "messages": [{"role": "user", "content": "Test query"}],
-            "system": "Test system prompt",
-            "tools": [{"name": "search_course_content"}],
-        }
+    async def test_generate_response_comparison_without_tools(
+        self, ai_generator, mock_anthropic_client
+    ):
+        """Test comparison queries make a single call when no tools are offered"""
+        mock_response = Mock()
+        mock_response.content = [Mock(text="Direct answer")]
+        mock_response.stop_reason = "end_turn"
+        mock_anthropic_client.messages.create.return_value = mock_response
 
-        # Test with max_rounds=1
-        result = ai_generator._handle_tool_execution(
-            mock_tool_response, base_params, mock_tool_manager, max_rounds=1
-        )
+        result = await ai_generator.generate_response("MCP vs RAG")
 
-        # Should execute tool once and make final call
-        mock_tool_manager.execute_tool.assert_called_once()
-        assert mock_anthropic_client.messages.create.call_count == 1
-        assert result == "Final answer"
+        assert result == "Direct answer"
+        mock_anthropic_client.messages.create.assert_called_once()
 
-    def test_backwards_compatibility_single_round(
-        self,
-        ai_generator,
-        mock_anthropic_client,
-        mock_tool_use_response,
-        mock_final_response,
+    async def test_generate_response_comparison_needs_question(
+        self, ai_generator, mock_anthropic_client
     ):
-        """Test that existing single-round behavior is preserved"""
-        tools = [{"name": "search_course_content", "description": "Search courses"}]
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Search result"
+        """Test comparisons are only detected from the raw question"""
+        mock_response = Mock()
+        mock_response.content = [Mock(text="Direct answer")]
+        mock_response.stop_reason = "end_turn"
+        mock_anthropic_client.messages.create.return_value = mock_response
 
-        # Set up single tool use followed by final response (original behavior)
-        mock_anthropic_client.messages.create.side_effect = [
-            mock_tool_use_response,
-            mock_final_response,
-        ]
+        result = await ai_generator.generate_response(
+            "MCP vs RAG",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=Mock(),
+        )
 
-        result = ai_generator.generate_response(
-            "Simple query", tools=tools, tool_manager=mock_tool_manager
+        assert result == "Direct answer"
+        mock_anthropic_client.messages.create.assert_called_once()
+
+    async def test_close(self, ai_generator, mock_anthropic_client):
+        """Test close waits for cache writes, then releases the pool and client"""
+        mock_cache = Mock()
+        mock_cache.get.return_value = None
+        ai_generator.response_cache = mock_cache
+        await ai_generator.generate_response("Wrapped prompt", cache_key="What is ML?")
+
+        await ai_generator.close()
+
+        mock_cache.set.assert_called_once()
+        assert not ai_generator._pending_writes
+        mock_anthropic_client.close.assert_awaited_once()
+        with pytest.raises(RuntimeError):
+            ai_generator.tool_executor.submit(print)
+
+    async def test_generate_batch(self, ai_generator, mock_anthropic_client):
+        """Test batch generation submits, polls, and reorders results"""
+        batches = mock_anthropic_client.messages.batches
+        batches.create = AsyncMock(
+            return_value=Mock(id="batch_1", processing_status="in_progress")
+        )
+        batches.retrieve = AsyncMock(
+            return_value=Mock(id="batch_1", processing_status="ended")
         )
 
-        # Should make 2 API calls (same as original)
-        assert mock_anthropic_client.messages.create.call_count == 2
+        def batch_entry(custom_id, result_type, text=None):
+            entry = Mock()
+            entry.custom_id = custom_id
+            entry.result.type = result_type
+            entry.result.message.content = [Mock(text=text)]
+            return entry
+
+        async def results_stream():
+            for entry in (
+                batch_entry("query-2", "succeeded", "Answer 3"),
+                batch_entry("query-0", "succeeded", "Answer 1"),
+                batch_entry("query-1", "errored"),
+            ):
+                yield entry
+
+        batches.results = AsyncMock(return_value=results_stream())
+
+        result = await ai_generator.generate_batch(
+            [("Question 1", None), ("Question 2", None), ("Question 1", "History")],
+            poll_interval=0,
+        )
 
-        # Should execute 1 tool (same as original)
-        mock_tool_manager.execute_tool.assert_called_once()
+        assert result == ["Answer 1", None, "Answer 3"]
+        batches.retrieve.assert_awaited_once_with("batch_1")
+        batches.results.assert_awaited_once_with("batch_1")
 
-        # Should return expected result
-        assert result == "Here's what I found about test query..."
+        requests = batches.create.call_args.kwargs["requests"]
+        assert [r["custom_id"] for r in requests] == ["query-0", "query-1", "query-2"]
+        assert requests[0]["params"]["system"] == ai_generator.SYSTEM_BLOCKS
+        assert "History" in requests[2]["params"]["system"][1]["text"]
+        assert "tools" not in requests[0]["params"]
 
-    def test_system_prompt_content(self, ai_generator):
+    def test_system_prompt_content(self, ai_generator_readonly):
         """Test that system prompt contains expected content"""
-        system_prompt = ai_generator.SYSTEM_PROMPT
-
-        # Check for key instruction elements
-        assert "search_course_content" in system_prompt
-        assert "get_course_outline" in system_prompt
-        assert "Sequential tool usage" in system_prompt
-        assert "up to 2 rounds maximum" in system_prompt
-        assert "Round 1" in system_prompt
-        assert "Round 2" in system_prompt
-        assert "Build context" in system_prompt
-        assert "Brief, Concise and focused" in system_prompt
-        assert "Educational" in system_prompt
-        assert "Comprehensive" in system_prompt
-
-    def test_base_params_structure(self, ai_generator):
+        # Check for key instruction elements, reporting every missing one
+        keywords = (
+            "search_course_content",
+            "get_course_outline",
+            "Up to 2 rounds of tool use",
+            "Round 1",
+            "Round 2",
+            "never repeat an identical call",
+            "brief and focused",
+            "educational",
+            "final synthesized answer",
+        )
+        missing = [k for k in keywords if k not in ai_generator_readonly.SYSTEM_PROMPT]
+        assert not missing, f"Missing keywords: {missing}"
+
+    def test_base_params_structure(self, ai_generator_readonly):
         """Test that base_params are structured correctly"""
-        base_params = ai_generator.base_params
+        base_params = ai_generator_readonly.base_params
 
         assert base_params["model"] == "claude-sonnet-4-20250514"
         assert base_params["temperature"] == 0
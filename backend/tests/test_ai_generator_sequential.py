@@ -0,0 +1,156 @@
+from unittest.mock import Mock, call
+
+import pytest
+
+# Multi-round tool tests drive the most mock API calls; deselect them with
+# -m "not slow" for a faster edit-test loop
+pytestmark = pytest.mark.slow
+
+
+class TestAIGeneratorSequential:
+    """Test suite for AIGenerator sequential tool calling rounds"""
+
+    @pytest.mark.parametrize(
+        "rounds,api_calls",
+        [(1, 2), (2, 3)],
+        ids=["single_round", "max_rounds"],
+    )
+    async def test_sequential_tool_calling(
+        self,
+        ai_generator,
+        mock_anthropic_client,
+        make_tool_block,
+        make_tool_response,
+        make_text_response,
+        rounds,
+        api_calls,
+        queue_responses,
+    ):
+        """Test tool rounds run until Claude answers or the round limit is hit"""
+        round_numbers = range(1, rounds + 1)
+        mock_tool_manager = Mock()
+        mock_tool_manager.execute_tool.side_effect = (
+            f"Round {n} result" for n in round_numbers
+        )
+
+        # One tool use response per round, then the final response
+        queue_responses(
+            *(
+                make_tool_response(
+                    [
+                        make_tool_block(
+                            "search_course_content",
+                            {"query": f"search {n}"},
+                            f"tool_{n}",
+                        )
+                    ]
+                )
+                for n in round_numbers
+            ),
+            make_text_response("Final answer"),
+        )
+
+        result = await ai_generator.generate_response(
+            "Complex query",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=mock_tool_manager,
+        )
+
+        # Initial call plus one follow-up per round
+        calls = mock_anthropic_client.messages.create.call_args_list
+        assert len(calls) == api_calls
+        assert mock_tool_manager.execute_tool.call_args_list == [
+            call("search_course_content", sources=None, query=f"search {n}")
+            for n in round_numbers
+        ]
+
+        # Tool use is forbidden only once the round limit is reached
+        final_call_args = calls[-1].kwargs
+        assert final_call_args["tool_choice"] == (
+            {"type": "auto"} if rounds < 2 else {"type": "none"}
+        )
+
+        # Each round's output is sent back, and only the newest tool result
+        # carries the cache breakpoint
+        tool_results = [m["content"][0] for m in final_call_args["messages"][2::2]]
+        assert [r["content"] for r in tool_results] == [
+            f"Round {n} result" for n in round_numbers
+        ]
+        assert [r.get("cache_control") for r in tool_results] == [None] * (
+            rounds - 1
+        ) + [{"type": "ephemeral"}]
+
+        assert result == "Final answer"
+
+    async def test_handle_tool_execution_with_max_rounds_parameter(
+        self,
+        ai_generator,
+        mock_anthropic_client,
+        make_tool_block,
+        make_tool_response,
+        make_text_response,
+        queue_responses,
+        tool_round_params,
+    ):
+        """Test _handle_tool_execution with custom max_rounds parameter"""
+        mock_tool_manager = Mock()
+        mock_tool_manager.execute_tool.return_value = "Tool result"
+
+        mock_tool_response = make_tool_response(
+            [make_tool_block("search_course_content", {"query": "test"}, "tool_1")]
+        )
+        queue_responses(make_text_response("Final answer"))
+
+        base_params = {
+            **tool_round_params,
+            "tools": [{"name": "search_course_content"}],
+        }
+
+        # Test with max_rounds=1
+        result = await ai_generator._handle_tool_execution(
+            mock_tool_response, base_params, mock_tool_manager, max_rounds=1
+        )
+
+        # Should execute tool once and make final call
+        mock_tool_manager.execute_tool.assert_called_once()
+        assert mock_anthropic_client.messages.create.call_count == 1
+        assert result == "Final answer"
+
+    async def test_final_round_keeps_cached_prefix(
+        self,
+        ai_generator,
+        mock_anthropic_client,
+        make_tool_block,
+        make_tool_response,
+        make_text_response,
+        queue_responses,
+    ):
+        """Test the forced final round resends the cached tools and system"""
+        mock_tool_manager = Mock()
+        mock_tool_manager.execute_tool.return_value = "Tool result"
+        queue_responses(
+            *(
+                make_tool_response(
+                    [make_tool_block("search_course_content", {"query": "q"}, f"t{n}")]
+                )
+                for n in (1, 2)
+            ),
+            make_text_response("Final answer"),
+        )
+
+        await ai_generator.generate_response(
+            "Complex query",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=mock_tool_manager,
+        )
+
+        calls = mock_anthropic_client.messages.create.call_args_list
+        assert len(calls) == 3
+
+        # Tools and system come before messages in the cache prefix, so any
+        # change to them on the final round would miss the cached turns
+        first, *rest = (c.kwargs for c in calls)
+        for params in rest:
+            assert params["tools"] == first["tools"]
+            assert params["system"] == first["system"]
+        assert calls[-1].kwargs["tool_choice"] == {"type": "none"}
@@ -1,15 +1,32 @@
 import pytest
-import json
+import orjson
 from unittest.mock import Mock
 from fastapi import HTTPException
+from fastapi.middleware.cors import CORSMiddleware
 from httpx import AsyncClient
 
+# Every test shares the session-scoped async client, so they all run on the
+# session event loop it was opened on
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+# Large inputs are built once at import rather than inside test parameters
+_LONG_QUERY = "What is " + "machine learning " * 100 + "?"
+_MANY_COURSE_TITLES = [f"Course {i}" for i in range(100)]
+
+# Fixed request bodies, encoded once and sent as raw content
+_JSON_HEADERS = {"content-type": "application/json"}
+_MISSING_QUERY_BODY = orjson.dumps({"session_id": "test"})
+_TEST_QUERY_BODY = orjson.dumps({"query": "test query"})
+_ASYNC_QUERY_BODY = orjson.dumps({"query": "async test"})
+_QUERY1_BODY = orjson.dumps({"query": "query1"})
+_QUERY2_BODY = orjson.dumps({"query": "query2"})
+
 
 @pytest.mark.api
 class TestQueryEndpoint:
     """Test cases for the /api/query endpoint"""
 
-    def test_query_endpoint_success(self, test_client, mock_rag_system, sample_query_request, sample_query_response):
+    async def test_query_endpoint_success(self, async_test_client, mock_rag_system, sample_query_request, sample_query_response):
         """Test successful query endpoint request"""
         # Setup mock response
         mock_rag_system.query.return_value = (
@@ -17,113 +34,90 @@ class TestQueryEndpoint:
             sample_query_response["sources"]
         )
         
-        response = test_client.post("/api/query", json=sample_query_request)
+        response = await async_test_client.post("/api/query", json=sample_query_request)
         
         assert response.status_code == 200
-        data = response.json()
+        data = orjson.loads(response.content)
         
         assert data["answer"] == sample_query_response["answer"]
         assert data["sources"] == sample_query_response["sources"]
         assert data["session_id"] == sample_query_request["session_id"]
         
-        # Verify RAG system was called correctly
+        # Call forwarding is verified here only; the input variants below
+        # exercise the same body parsing
         mock_rag_system.query.assert_called_once_with(
             sample_query_request["query"],
             sample_query_request["session_id"]
         )
 
-    def test_query_endpoint_without_session_id(self, test_client, mock_rag_system):
-        """Test query endpoint without session_id creates new session"""
-        # Setup mock
-        mock_rag_system.query.return_value = ("Test answer", [])
-        
-        request_data = {"query": "What is Python?"}
-        response = test_client.post("/api/query", json=request_data)
-        
-        assert response.status_code == 200
-        data = response.json()
-        
-        assert data["answer"] == "Test answer"
-        assert data["session_id"] == "test_session"  # Default session from mock
-        
-        # Verify RAG system was called with default session
-        mock_rag_system.query.assert_called_once_with("What is Python?", "test_session")
-
-    def test_query_endpoint_empty_query(self, test_client, mock_rag_system):
-        """Test query endpoint with empty query string"""
-        mock_rag_system.query.return_value = ("Please provide a question", [])
-        
-        request_data = {"query": ""}
-        response = test_client.post("/api/query", json=request_data)
-        
-        assert response.status_code == 200
-        mock_rag_system.query.assert_called_once_with("", "test_session")
-
-    def test_query_endpoint_missing_query_field(self, test_client):
+    async def test_query_endpoint_missing_query_field(self, async_test_client):
         """Test query endpoint with missing query field"""
-        request_data = {"session_id": "test"}
-        response = test_client.post("/api/query", json=request_data)
+        response = await async_test_client.post(
+            "/api/query", content=_MISSING_QUERY_BODY, headers=_JSON_HEADERS
+        )
         
         assert response.status_code == 422  # Validation error
 
-    def test_query_endpoint_invalid_json(self, test_client):
+    async def test_query_endpoint_invalid_json(self, async_test_client):
         """Test query endpoint with invalid JSON"""
-        response = test_client.post(
+        response = await async_test_client.post(
             "/api/query",
-            data="invalid json",
-            headers={"content-type": "application/json"}
+            content="invalid json",
+            headers=_JSON_HEADERS
         )
         
         assert response.status_code == 422
 
-    def test_query_endpoint_rag_system_exception(self, test_client, mock_rag_system):
+    async def test_query_endpoint_rag_system_exception(self, async_test_client, mock_rag_system):
         """Test query endpoint when RAG system raises exception"""
         # Setup mock to raise exception
         mock_rag_system.query.side_effect = Exception("Database connection error")
         
-        request_data = {"query": "test query"}
-        response = test_client.post("/api/query", json=request_data)
+        response = await async_test_client.post(
+            "/api/query", content=_TEST_QUERY_BODY, headers=_JSON_HEADERS
+        )
         
         assert response.status_code == 500
-        data = response.json()
+        data = orjson.loads(response.content)
         assert "Database connection error" in data["detail"]
 
-    def test_query_endpoint_long_query(self, test_client, mock_rag_system):
-        """Test query endpoint with very long query string"""
-        long_query = "What is " + "machine learning " * 100 + "?"
-        mock_rag_system.query.return_value = ("Long answer", [])
+    @pytest.mark.parametrize("query,session_id", [
+        ("What is Python?", None),
+        ("", None),
+        (_LONG_QUERY, None),
+        ("What is machine learning? 🤖 Explain with émojis & symbols!", None),
+        ("What is Python?", "existing_session"),
+    ], ids=["no_session", "empty", "long", "special_characters", "with_session"])
+    async def test_query_endpoint_inputs(self, async_test_client, mock_rag_system, query, session_id):
+        """Test query endpoint accepts any query and defaults the session"""
+        mock_rag_system.query.return_value = ("Test answer", [])
+        expected_session = session_id or "test_session"  # Default session from mock
         
-        request_data = {"query": long_query}
-        response = test_client.post("/api/query", json=request_data)
+        request_data = {"query": query}
+        if session_id:
+            request_data["session_id"] = session_id
+        response = await async_test_client.post("/api/query", json=request_data)
         
         assert response.status_code == 200
-        mock_rag_system.query.assert_called_once_with(long_query, "test_session")
-
-    def test_query_endpoint_special_characters(self, test_client, mock_rag_system):
-        """Test query endpoint with special characters and unicode"""
-        special_query = "What is machine learning? 🤖 Explain with émojis & symbols!"
-        mock_rag_system.query.return_value = ("Answer with special chars", [])
-        
-        request_data = {"query": special_query}
-        response = test_client.post("/api/query", json=request_data)
+        data = orjson.loads(response.content)
         
-        assert response.status_code == 200
-        mock_rag_system.query.assert_called_once_with(special_query, "test_session")
+        assert data["answer"] == "Test answer"
+        assert data["session_id"] == expected_session
 
 
 @pytest.mark.api
 class TestCoursesEndpoint:
     """Test cases for the /api/courses endpoint"""
 
-    def test_courses_endpoint_success(self, test_client, mock_rag_system, sample_course_analytics):
+    async def test_courses_endpoint_success(self, async_test_client, mock_rag_system, sample_course_analytics):
         """Test successful courses endpoint request"""
         # Setup mock response
         mock_rag_system.get_course_analytics.return_value = sample_course_analytics
         
-        response = test_client.get("/api/courses")
+        response = await async_test_client.get("/api/courses")
         
         assert response.status_code == 200
-        data = response.json()
+        data = orjson.loads(response.content)
         
         assert data["total_courses"] == sample_course_analytics["total_courses"]
         assert data["course_titles"] == sample_course_analytics["course_titles"]
@@ -131,98 +125,57 @@ class TestCoursesEndpoint:
         # Verify RAG system was called
         mock_rag_system.get_course_analytics.assert_called_once()
 
-    def test_courses_endpoint_empty_courses(self, test_client, mock_rag_system):
-        """Test courses endpoint with no courses"""
-        # Setup mock for empty state
-        mock_rag_system.get_course_analytics.return_value = {
-            "total_courses": 0,
-            "course_titles": []
-        }
-        
-        response = test_client.get("/api/courses")
-        
-        assert response.status_code == 200
-        data = response.json()
-        
-        assert data["total_courses"] == 0
-        assert data["course_titles"] == []
-
-    def test_courses_endpoint_rag_system_exception(self, test_client, mock_rag_system):
+    async def test_courses_endpoint_rag_system_exception(self, async_test_client, mock_rag_system):
         """Test courses endpoint when RAG system raises exception"""
         # Setup mock to raise exception
         mock_rag_system.get_course_analytics.side_effect = Exception("Vector store error")
         
-        response = test_client.get("/api/courses")
+        response = await async_test_client.get("/api/courses")
         
         assert response.status_code == 500
-        data = response.json()
+        data = orjson.loads(response.content)
         assert "Vector store error" in data["detail"]
 
-    def test_courses_endpoint_large_dataset(self, test_client, mock_rag_system):
-        """Test courses endpoint with large number of courses"""
-        # Create mock data for many courses
-        many_courses = {
-            "total_courses": 100,
-            "course_titles": [f"Course {i}" for i in range(100)]
-        }
-        mock_rag_system.get_course_analytics.return_value = many_courses
-        
-        response = test_client.get("/api/courses")
-        
-        assert response.status_code == 200
-        data = response.json()
-        assert data["total_courses"] == 100
-        assert len(data["course_titles"]) == 100
-
-    def test_courses_endpoint_unicode_titles(self, test_client, mock_rag_system):
-        """Test courses endpoint with unicode course titles"""
-        unicode_courses = {
+    @pytest.mark.parametrize("analytics", [
+        {"total_courses": 0, "course_titles": []},
+        {"total_courses": 100, "course_titles": _MANY_COURSE_TITLES},
+        {
             "total_courses": 3,
             "course_titles": [
                 "機械学習入門 (ML Introduction)",
-                "Introducción a Python 🐍", 
+                "Introducción a Python 🐍",
                 "数据结构与算法"
             ]
-        }
-        mock_rag_system.get_course_analytics.return_value = unicode_courses
+        },
+    ], ids=["empty", "large_dataset", "unicode_titles"])
+    async def test_courses_endpoint_analytics(self, async_test_client, mock_rag_system, analytics):
+        """Test courses endpoint returns the analytics unchanged"""
+        mock_rag_system.get_course_analytics.return_value = analytics
         
-        response = test_client.get("/api/courses")
+        response = await async_test_client.get("/api/courses")
         
         assert response.status_code == 200
-        data = response.json()
-        assert data["total_courses"] == 3
-        assert all(title in data["course_titles"] for title in unicode_courses["course_titles"])
+        assert orjson.loads(response.content) == analytics
 
 
 @pytest.mark.api
 class TestRootEndpoint:
     """Test cases for the root / endpoint"""
 
-    def test_root_endpoint_success(self, test_client):
+    async def test_root_endpoint_success(self, async_test_client):
         """Test successful root endpoint request"""
-        response = test_client.get("/")
+        response = await async_test_client.get("/")
         
         assert response.status_code == 200
-        data = response.json()
+        data = orjson.loads(response.content)
         assert data["message"] == "RAG System API"
 
-    def test_root_endpoint_head_request(self, test_client):
-        """Test HEAD request to root endpoint"""
-        response = test_client.head("/")
-        
-        # HEAD method returns 405 for this endpoint since only GET is defined
-        assert response.status_code == 405
-
-    def test_root_endpoint_options_request(self, test_client):
-        """Test OPTIONS request to root endpoint (CORS)"""
-        response = test_client.options("/")
-        
-        # Should be handled by CORS middleware
-        assert response.status_code in [200, 405]
+    async def test_cors_middleware_installed(self, test_app):
+        """Test CORS is configured on the app without dispatching a preflight"""
+        assert CORSMiddleware in [m.cls for m in test_app.user_middleware]
 
 
 @pytest.mark.api
-@pytest.mark.asyncio
 class TestAsyncEndpoints:
     """Test cases using async client for more realistic testing"""
 
@@ -232,11 +185,12 @@ class TestAsyncEndpoints:
         
         response = await async_test_client.post(
             "/api/query",
-            json={"query": "async test"}
+            content=_ASYNC_QUERY_BODY,
+            headers=_JSON_HEADERS
         )
         
         assert response.status_code == 200
-        data = response.json()
+        data = orjson.loads(response.content)
         assert data["answer"] == "Async response"
 
     async def test_async_courses_endpoint(self, async_test_client, mock_rag_system):
@@ -249,23 +203,18 @@ class TestAsyncEndpoints:
         response = await async_test_client.get("/api/courses")
         
         assert response.status_code == 200
-        data = response.json()
+        data = orjson.loads(response.content)
         assert data["total_courses"] == 5
 
     async def test_async_concurrent_requests(self, async_test_client, mock_rag_system):
         """Test handling multiple concurrent requests"""
         import asyncio
         
-        # Setup different responses for different queries
-        def mock_query_side_effect(query, session_id):
-            if "query1" in query:
-                return ("Answer 1", [])
-            elif "query2" in query:
-                return ("Answer 2", [])
-            else:
-                return ("Default answer", [])
-        
-        mock_rag_system.query.side_effect = mock_query_side_effect
+        # Setup different responses for the exact queries sent below
+        answers = {"query1": ("Answer 1", []), "query2": ("Answer 2", [])}
+        mock_rag_system.query.side_effect = lambda query, session_id: answers.get(
+            query, ("Default answer", [])
+        )
         mock_rag_system.get_course_analytics.return_value = {
             "total_courses": 1,
             "course_titles": ["Test Course"]
@@ -273,8 +222,8 @@ class TestAsyncEndpoints:
         
         # Send concurrent requests
         tasks = [
-            async_test_client.post("/api/query", json={"query": "query1"}),
-            async_test_client.post("/api/query", json={"query": "query2"}),
+            async_test_client.post("/api/query", content=_QUERY1_BODY, headers=_JSON_HEADERS),
+            async_test_client.post("/api/query", content=_QUERY2_BODY, headers=_JSON_HEADERS),
             async_test_client.get("/api/courses")
         ]
         
@@ -289,83 +238,71 @@ class TestAsyncEndpoints:
         assert all(r.status_code == 200 for r in responses)
         
         # Verify correct responses
-        assert responses[0].json()["answer"] == "Answer 1"
-        assert responses[1].json()["answer"] == "Answer 2"
-        assert responses[2].json()["total_courses"] == 1
+        assert orjson.loads(responses[0].content)["answer"] == "Answer 1"
+        assert orjson.loads(responses[1].content)["answer"] == "Answer 2"
+        assert orjson.loads(responses[2].content)["total_courses"] == 1
 
 
 @pytest.mark.api
 class TestErrorHandling:
     """Test error handling across all endpoints"""
 
-    def test_404_nonexistent_endpoint(self, test_client):
-        """Test 404 for non-existent endpoints"""
-        response = test_client.get("/api/nonexistent")
-        assert response.status_code == 404
-
-    def test_method_not_allowed(self, test_client):
-        """Test method not allowed errors"""
-        # Try GET on POST endpoint
-        response = test_client.get("/api/query")
-        assert response.status_code == 405
-        
-        # Try POST on GET endpoint
-        response = test_client.post("/api/courses")
-        assert response.status_code == 405
-
-    def test_malformed_content_type(self, test_client):
-        """Test requests with malformed content type"""
-        response = test_client.post(
-            "/api/query",
-            data="not json",
-            headers={"content-type": "text/plain"}
-        )
-        
-        assert response.status_code == 422
+    @pytest.mark.parametrize("method,path,content,headers,status", [
+        # Only GET is defined on the root endpoint
+        ("HEAD", "/", None, None, 405),
+        ("GET", "/api/nonexistent", None, None, 404),
+        ("GET", "/api/query", None, None, 405),
+        ("POST", "/api/courses", None, None, 405),
+        ("POST", "/api/query", "not json", {"content-type": "text/plain"}, 422),
+    ], ids=["root_head", "nonexistent", "get_query", "post_courses", "malformed_content_type"])
+    async def test_status_matrix(self, async_test_client, method, path, content, headers, status):
+        """Test status codes for unsupported methods, paths and bodies"""
+        response = await async_test_client.request(method, path, content=content, headers=headers)
+        assert response.status_code == status
 
 
 @pytest.mark.api 
 class TestResponseFormats:
     """Test response format validation"""
 
-    def test_query_response_format(self, test_client, mock_rag_system):
+    async def test_query_response_format(self, async_test_client, mock_rag_system):
         """Test that query responses match expected format"""
         mock_rag_system.query.return_value = (
             "Test answer",
             [{"text": "Source 1", "link": "http://example.com"}]
         )
         
-        response = test_client.post("/api/query", json={"query": "test"})
+        response = await async_test_client.post(
+            "/api/query", content=_TEST_QUERY_BODY, headers=_JSON_HEADERS
+        )
         
         assert response.status_code == 200
-        data = response.json()
+        data = orjson.loads(response.content)
         
         # Verify required fields exist
-        required_fields = {"answer", "sources", "session_id"}
-        assert set(data.keys()) == required_fields
+        assert set(data.keys()) == {"answer", "sources", "session_id"}
         
         # Verify field types
         assert isinstance(data["answer"], str)
         assert isinstance(data["sources"], list)
         assert isinstance(data["session_id"], str)
 
-    def test_courses_response_format(self, test_client, mock_rag_system):
+    async def test_courses_response_format(self, async_test_client, mock_rag_system):
         """Test that courses responses match expected format"""
         mock_rag_system.get_course_analytics.return_value = {
             "total_courses": 2,
             "course_titles": ["Course A", "Course B"]
         }
         
-        response = test_client.get("/api/courses")
+        response = await async_test_client.get("/api/courses")
         
         assert response.status_code == 200
-        data = response.json()
+        data = orjson.loads(response.content)
         
         # Verify required fields exist
-        required_fields = {"total_courses", "course_titles"}
-        assert set(data.keys()) == required_fields
+        assert set(data.keys()) == {"total_courses", "course_titles"}
         
         # Verify field types
         assert isinstance(data["total_courses"], int)
         assert isinstance(data["course_titles"], list)
-        assert all(isinstance(title, str) for title in data["course_titles"])
\ No newline at end of file
+        assert all(isinstance(title, str) for title in data["course_titles"])
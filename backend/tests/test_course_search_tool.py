@@ -1,23 +1,27 @@
-import os
-import sys
 from unittest.mock import Mock, patch
 
 import pytest
-
-# Add backend directory to Python path
-backend_path = os.path.dirname(os.path.abspath(__file__)).replace("/tests", "")
-sys.path.insert(0, backend_path)
-
 from search_tools import CourseSearchTool
 from vector_store import SearchResults
 
+SINGLE_RESULT = SearchResults(
+    documents=["Single result"],
+    metadata=[{"course_title": "Another Course", "lesson_number": 5}],
+    distances=[0.1],
+)
+
+
+@pytest.fixture
+def tool(mock_vector_store):
+    """CourseSearchTool backed by the test's mock vector store"""
+    return CourseSearchTool(mock_vector_store)
+
 
 class TestCourseSearchTool:
     """Test suite for CourseSearchTool.execute() method"""
 
-    def test_get_tool_definition(self, mock_vector_store):
+    def test_get_tool_definition(self, tool):
         """Test that tool definition is returned correctly"""
-        tool = CourseSearchTool(mock_vector_store)
         definition = tool.get_tool_definition()
 
         assert definition["name"] == "search_course_content"
@@ -30,99 +34,86 @@ class TestCourseSearchTool:
         assert "lesson_number" in definition["input_schema"]["properties"]
         assert definition["input_schema"]["required"] == ["query"]
 
-    def test_execute_query_only_success(self, mock_vector_store, sample_search_results):
+    def test_execute_query_only_success(
+        self, tool, mock_vector_store, sample_search_results
+    ):
         """Test execute with query only - successful search"""
         mock_vector_store.search.return_value = sample_search_results
-        mock_vector_store.get_lesson_link.return_value = "https://example.com/lesson1"
 
-        tool = CourseSearchTool(mock_vector_store)
-        result = tool.execute("machine learning basics")
-
-        # Verify search was called correctly
-        mock_vector_store.search.assert_called_once_with(
-            query="machine learning basics", course_name=None, lesson_number=None
-        )
+        sources = []
+        result = tool.execute("machine learning basics", sources=sources)
 
         # Verify result formatting
         assert "[Introduction to Machine Learning - Lesson 1]" in result
         assert "Machine learning is a method of data analysis" in result
         assert "It is a branch of artificial intelligence" in result
 
-        # Verify sources were tracked
-        assert len(tool.last_sources) == 2
-        assert (
-            tool.last_sources[0]["text"]
-            == "Introduction to Machine Learning - Lesson 1"
-        )
-        assert tool.last_sources[0]["link"] == "https://example.com/lesson1"
-
-    def test_execute_with_course_name(self, mock_vector_store, sample_search_results):
-        """Test execute with course name filter"""
-        mock_vector_store.search.return_value = sample_search_results
-
-        tool = CourseSearchTool(mock_vector_store)
-        result = tool.execute("regression", course_name="Machine Learning")
-
-        mock_vector_store.search.assert_called_once_with(
-            query="regression", course_name="Machine Learning", lesson_number=None
-        )
-
-        assert "Introduction to Machine Learning - Lesson 1" in result
-
-    def test_execute_with_lesson_number(self, mock_vector_store, sample_search_results):
-        """Test execute with lesson number filter"""
-        mock_vector_store.search.return_value = sample_search_results
-
-        tool = CourseSearchTool(mock_vector_store)
-        result = tool.execute("regression", lesson_number=2)
-
-        mock_vector_store.search.assert_called_once_with(
-            query="regression", course_name=None, lesson_number=2
-        )
-
-    def test_execute_with_both_filters(self, mock_vector_store, sample_search_results):
-        """Test execute with both course name and lesson number filters"""
+        # Verify sources were collected
+        assert len(sources) == 2
+        assert sources[0]["text"] == "Introduction to Machine Learning - Lesson 1"
+        # Lesson link comes from the mock_vector_store default
+        assert sources[0]["link"] == "https://example.com/test/lesson1"
+
+    @pytest.mark.parametrize(
+        "course_name,lesson_number",
+        [
+            (None, None),
+            ("Machine Learning", None),
+            (None, 2),
+            ("ML Course", 3),
+            # Empty string should be passed as-is to vector store
+            ("", None),
+        ],
+        ids=[
+            "no_filters",
+            "course_name",
+            "lesson_number",
+            "both_filters",
+            "empty_course_name",
+        ],
+    )
+    def test_execute_filter_forwarding(
+        self, tool, mock_vector_store, sample_search_results, course_name, lesson_number
+    ):
+        """Test execute passes the filters through to the vector store"""
         mock_vector_store.search.return_value = sample_search_results
 
-        tool = CourseSearchTool(mock_vector_store)
-        result = tool.execute("regression", course_name="ML Course", lesson_number=3)
+        tool.execute("q", course_name=course_name, lesson_number=lesson_number)
 
         mock_vector_store.search.assert_called_once_with(
-            query="regression", course_name="ML Course", lesson_number=3
+            query="q", course_name=course_name, lesson_number=lesson_number
         )
 
-    def test_execute_empty_results(self, mock_vector_store, empty_search_results):
+    def test_execute_empty_results(self, tool, mock_vector_store, empty_search_results):
         """Test execute when search returns no results"""
         mock_vector_store.search.return_value = empty_search_results
 
-        tool = CourseSearchTool(mock_vector_store)
-        result = tool.execute("nonexistent topic")
+        sources = []
+        result = tool.execute("nonexistent topic", sources=sources)
 
         assert result == "No relevant content found."
-        assert len(tool.last_sources) == 0
+        assert sources == []
 
     def test_execute_empty_results_with_filters(
-        self, mock_vector_store, empty_search_results
+        self, tool, mock_vector_store, empty_search_results
     ):
         """Test execute when search returns no results with filters applied"""
         mock_vector_store.search.return_value = empty_search_results
 
-        tool = CourseSearchTool(mock_vector_store)
         result = tool.execute("topic", course_name="Test Course", lesson_number=5)
 
         expected = "No relevant content found in course 'Test Course' in lesson 5."
         assert result == expected
 
-    def test_execute_search_error(self, mock_vector_store, error_search_results):
+    def test_execute_search_error(self, tool, mock_vector_store, error_search_results):
         """Test execute when search returns an error"""
         mock_vector_store.search.return_value = error_search_results
 
-        tool = CourseSearchTool(mock_vector_store)
         result = tool.execute("test query")
 
         assert result == "Search error occurred"
 
-    def test_execute_with_missing_metadata(self, mock_vector_store):
+    def test_execute_with_missing_metadata(self, tool, mock_vector_store):
         """Test execute with incomplete metadata"""
         # Create search results with missing metadata
         incomplete_results = SearchResults(
@@ -130,88 +121,59 @@ class TestCourseSearchTool:
         )
         mock_vector_store.search.return_value = incomplete_results
 
-        tool = CourseSearchTool(mock_vector_store)
         result = tool.execute("test query")
 
         assert "[unknown]" in result
         assert "Some content" in result
 
     def test_format_results_no_lesson_link(
-        self, mock_vector_store, sample_search_results
+        self, tool, mock_vector_store, sample_search_results
     ):
         """Test formatting when lesson link is not available but course link is"""
         mock_vector_store.search.return_value = sample_search_results
         mock_vector_store.get_lesson_link.return_value = None
         mock_vector_store.get_course_link.return_value = "https://example.com/course"
 
-        tool = CourseSearchTool(mock_vector_store)
-        result = tool.execute("test query")
+        sources = []
+        tool.execute("test query", sources=sources)
 
         # Should use course link when lesson link unavailable
-        assert tool.last_sources[0]["link"] == "https://example.com/course"
+        assert sources[0]["link"] == "https://example.com/course"
 
-    def test_format_results_no_links(self, mock_vector_store, sample_search_results):
+    def test_format_results_no_links(
+        self, tool, mock_vector_store, sample_search_results
+    ):
         """Test formatting when no links are available"""
         mock_vector_store.search.return_value = sample_search_results
         mock_vector_store.get_lesson_link.return_value = None
         mock_vector_store.get_course_link.return_value = None
 
-        tool = CourseSearchTool(mock_vector_store)
-        result = tool.execute("test query")
+        sources = []
+        tool.execute("test query", sources=sources)
 
         # Should have None link when no links available
-        assert tool.last_sources[0]["link"] is None
-
-    def test_execute_with_none_parameters(
-        self, mock_vector_store, sample_search_results
-    ):
-        """Test execute with explicitly None parameters"""
-        mock_vector_store.search.return_value = sample_search_results
-
-        tool = CourseSearchTool(mock_vector_store)
-        result = tool.execute("test query", course_name=None, lesson_number=None)
-
-        mock_vector_store.search.assert_called_once_with(
-            query="test query", course_name=None, lesson_number=None
-        )
+        assert sources[0]["link"] is None
 
-    def test_execute_with_empty_string_course_name(
-        self, mock_vector_store, sample_search_results
+    def test_sources_collected_per_call(
+        self, tool, mock_vector_store, sample_search_results
     ):
-        """Test execute with empty string course name"""
+        """Test that each search only adds to the sources list it was given"""
         mock_vector_store.search.return_value = sample_search_results
 
-        tool = CourseSearchTool(mock_vector_store)
-        result = tool.execute("test query", course_name="", lesson_number=None)
-
-        # Empty string should be passed as-is to vector store
-        mock_vector_store.search.assert_called_once_with(
-            query="test query", course_name="", lesson_number=None
-        )
-
-    def test_last_sources_reset_on_new_search(
-        self, mock_vector_store, sample_search_results
-    ):
-        """Test that last_sources is reset on each new search"""
-        mock_vector_store.search.return_value = sample_search_results
-        mock_vector_store.get_lesson_link.return_value = "https://example.com/lesson1"
-
-        tool = CourseSearchTool(mock_vector_store)
-
         # First search
-        tool.execute("first query")
-        first_sources = tool.last_sources.copy()
-        assert len(first_sources) == 2
+        first_sources = []
+        tool.execute("first query", sources=first_sources)
 
-        # Second search
-        single_result = SearchResults(
-            documents=["Single result"],
-            metadata=[{"course_title": "Another Course", "lesson_number": 5}],
-            distances=[0.1],
-        )
-        mock_vector_store.search.return_value = single_result
-        tool.execute("second query")
+        # Second search, as another query sharing the tool would run it
+        mock_vector_store.search.return_value = SINGLE_RESULT
+        second_sources = []
+        tool.execute("second query", sources=second_sources)
 
-        # Should have only sources from second search
-        assert len(tool.last_sources) == 1
-        assert tool.last_sources[0]["text"] == "Another Course - Lesson 5"
+        # Each list holds only the sources of its own search
+        assert len(first_sources) == 2
+        assert second_sources == [
+            {
+                "text": "Another Course - Lesson 5",
+                "link": "https://example.com/test/lesson1",
+            }
+        ]
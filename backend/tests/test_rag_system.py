@@ -1,49 +1,94 @@
 import os
-import sys
-from unittest.mock import MagicMock, Mock, patch
+from dataclasses import dataclass
+from unittest.mock import DEFAULT, Mock, call, patch
 
 import pytest
-
-# Add backend directory to Python path
-backend_path = os.path.dirname(os.path.abspath(__file__)).replace("/tests", "")
-sys.path.insert(0, backend_path)
-
+from ai_generator import AIGenerator
+from document_processor import DocumentProcessor
 from models import Course, Lesson
 from rag_system import RAGSystem
+from response_cache import SemanticResponseCache
+from search_tools import CourseOutlineTool, CourseSearchTool, ToolManager
+from session_manager import SessionManager
+from vector_store import VectorStore
+
+# Instruction RAGSystem.query puts in front of every user question
+_PROMPT_PREFIX = "Answer this question about course materials: "
+
+
+def _answer_with_sources(answer, found):
+    """Build a generate_response stand-in whose tools report found as sources"""
+
+    def generate_response(**kwargs):
+        kwargs["sources"].extend(found)
+        return answer
+
+    return generate_response
+
+
+@dataclass(frozen=True)
+class RagMocks:
+    """Mocked instances of every component RAGSystem constructs"""
+
+    document_processor: Mock
+    vector_store: Mock
+    ai_generator: Mock
+    session_manager: Mock
+    tool_manager: Mock
+    search_tool: Mock
+    outline_tool: Mock
+    response_cache: Mock
 
 
 class TestRAGSystem:
     """Integration tests for RAGSystem query handling"""
 
-    @pytest.fixture
-    def mock_dependencies(self, mock_config):
-        """Mock all RAGSystem dependencies"""
-        mocks = {}
-
-        # Mock all the components
-        with (
-            patch("rag_system.DocumentProcessor") as mock_doc_proc,
-            patch("rag_system.VectorStore") as mock_vector_store,
-            patch("rag_system.AIGenerator") as mock_ai_gen,
-            patch("rag_system.SessionManager") as mock_session_mgr,
-            patch("rag_system.ToolManager") as mock_tool_mgr,
-            patch("rag_system.CourseSearchTool") as mock_search_tool,
-            patch("rag_system.CourseOutlineTool") as mock_outline_tool,
-        ):
+    @pytest.fixture(scope="module")
+    def _patched_dependencies(self):
+        """Patch every RAGSystem dependency class once for the module"""
+        # Spec each instance against the real class so a misspelled method
+        # fails; async methods such as generate_response become AsyncMocks
+        specs = {
+            "document_processor": DocumentProcessor,
+            "vector_store": VectorStore,
+            "ai_generator": AIGenerator,
+            "session_manager": SessionManager,
+            "tool_manager": ToolManager,
+            "search_tool": CourseSearchTool,
+            "outline_tool": CourseOutlineTool,
+            "response_cache": SemanticResponseCache,
+        }
+        patcher = patch.multiple(
+            "rag_system", **{cls.__name__: DEFAULT for cls in specs.values()}
+        )
+        classes = patcher.start()
 
-            mocks["document_processor"] = mock_doc_proc.return_value
-            mocks["vector_store"] = mock_vector_store.return_value
-            mocks["ai_generator"] = mock_ai_gen.return_value
-            mocks["session_manager"] = mock_session_mgr.return_value
-            mocks["tool_manager"] = mock_tool_mgr.return_value
-            mocks["search_tool"] = mock_search_tool.return_value
-            mocks["outline_tool"] = mock_outline_tool.return_value
+        mocks = {}
+        for name, cls in specs.items():
+            mocks[name] = classes[cls.__name__].return_value = Mock(spec=cls)
 
-            yield mocks
+        yield RagMocks(**mocks)
+        patcher.stop()
 
     @pytest.fixture
-    def rag_system(self, mock_config, mock_dependencies):
-        """Create RAGSystem instance with mocked dependencies"""
+    def mock_dependencies(self, _patched_dependencies):
+        """Mock all RAGSystem dependencies, reset for this test"""
+        # The patches are shared across the module, so clear call history and
+        # any return values or side effects configured by earlier tests
+        for mock in vars(_patched_dependencies).values():
+            mock.reset_mock(return_value=True, side_effect=True)
+
+        # Defaults for a query that uses no tools; tests override what differs
+        tool_manager = _patched_dependencies.tool_manager
+        tool_manager.get_tool_definitions.return_value = []
+        return _patched_dependencies
+
+    @pytest.fixture(scope="module")
+    def rag_system(self, mock_config, _patched_dependencies):
+        """Create one RAGSystem instance with mocked dependencies for the module"""
+        # Tests request mock_dependencies as well, which resets the shared
+        # component mocks; construction-time calls are covered separately by
+        # test_rag_system_initialization
         return RAGSystem(mock_config)
 
     def test_rag_system_initialization(self, mock_config, mock_dependencies):
@@ -58,257 +103,196 @@ class TestRAGSystem:
         assert hasattr(rag, "tool_manager")
         assert hasattr(rag, "search_tool")
         assert hasattr(rag, "outline_tool")
+        assert hasattr(rag, "response_cache")
 
         # Verify tools were registered
-        mock_dependencies["tool_manager"].register_tool.assert_any_call(
-            mock_dependencies["search_tool"]
+        mock_dependencies.tool_manager.register_tool.assert_any_call(
+            mock_dependencies.search_tool
         )
-        mock_dependencies["tool_manager"].register_tool.assert_any_call(
-            mock_dependencies["outline_tool"]
+        mock_dependencies.tool_manager.register_tool.assert_any_call(
+            mock_dependencies.outline_tool
         )
 
-    def test_query_without_session_id(self, rag_system, mock_dependencies):
-        """Test query method without session ID"""
-        # Setup mocks
-        mock_dependencies["ai_generator"].generate_response.return_value = (
-            "Test AI response"
+    @pytest.mark.parametrize(
+        "query,session_id,history,tools,sources",
+        [
+            pytest.param(
+                "What is machine learning?",
+                None,
+                None,
+                [{"name": "test_tool"}],
+                [{"text": "Source 1", "link": "http://example.com"}],
+                id="no_session",
+            ),
+            pytest.param(
+                "Follow up question",
+                "session123",
+                "Previous conversation context",
+                [],
+                [],
+                id="with_session",
+            ),
+            pytest.param(
+                "Explain supervised learning",
+                None,
+                None,
+                [
+                    {"name": "search_course_content", "description": "Search courses"},
+                    {"name": "get_course_outline", "description": "Get outline"},
+                ],
+                [
+                    {
+                        "text": "ML Course - Lesson 1",
+                        "link": "http://example.com/ml/lesson1",
+                    },
+                    {
+                        "text": "ML Course - Lesson 2",
+                        "link": "http://example.com/ml/lesson2",
+                    },
+                ],
+                id="tool_usage",
+            ),
+            pytest.param(
+                "What is the capital of France?",
+                None,
+                None,
+                [],
+                [],
+                id="prompt_formatting",
+            ),
+        ],
+    )
+    async def test_query(
+        self, rag_system, mock_dependencies, query, session_id, history, tools, sources
+    ):
+        """Test query wraps the prompt, passes tools and history, and returns sources"""
+        session_manager = mock_dependencies.session_manager
+        tool_manager = mock_dependencies.tool_manager
+        session_manager.get_conversation_history.return_value = history
+        mock_dependencies.ai_generator.generate_response.side_effect = (
+            _answer_with_sources("Test AI response", sources)
         )
-        mock_dependencies["tool_manager"].get_tool_definitions.return_value = [
-            {"name": "test_tool"}
-        ]
-        mock_dependencies["tool_manager"].get_last_sources.return_value = [
-            {"text": "Source 1", "link": "http://example.com"}
-        ]
-
-        result, sources = rag_system.query("What is machine learning?")
-
-        # Verify AI generator was called correctly
-        mock_dependencies["ai_generator"].generate_response.assert_called_once_with(
-            query="Answer this question about course materials: What is machine learning?",
-            conversation_history=None,
-            tools=[{"name": "test_tool"}],
-            tool_manager=mock_dependencies["tool_manager"],
+        tool_manager.get_tool_definitions.return_value = tools
+
+        result, returned_sources = await rag_system.query(query, session_id=session_id)
+
+        # Verify the query was wrapped and tools and history were provided to AI
+        mock_dependencies.ai_generator.generate_response.assert_called_once_with(
+            query=_PROMPT_PREFIX + query,
+            conversation_history=history,
+            tools=tools,
+            tool_manager=tool_manager,
+            cache_key=query,
+            sources=sources,
         )
 
-        # Verify sources were retrieved and reset
-        mock_dependencies["tool_manager"].get_last_sources.assert_called_once()
-        mock_dependencies["tool_manager"].reset_sources.assert_called_once()
-
-        # Verify session manager was not called
-        mock_dependencies[
-            "session_manager"
-        ].get_conversation_history.assert_not_called()
-        mock_dependencies["session_manager"].add_exchange.assert_not_called()
+        # Session history is only read and updated when a session is given
+        if session_id is None:
+            session_manager.get_conversation_history.assert_not_called()
+            session_manager.add_exchange.assert_not_called()
+        else:
+            session_manager.get_conversation_history.assert_called_once_with(session_id)
+            session_manager.add_exchange.assert_called_once_with(
+                session_id, query, "Test AI response"
+            )
 
         assert result == "Test AI response"
-        assert sources == [{"text": "Source 1", "link": "http://example.com"}]
-
-    def test_query_with_session_id(self, rag_system, mock_dependencies):
-        """Test query method with session ID for conversation context"""
-        # Setup mocks
-        mock_dependencies["session_manager"].get_conversation_history.return_value = (
-            "Previous conversation context"
-        )
-        mock_dependencies["ai_generator"].generate_response.return_value = (
-            "Contextual AI response"
-        )
-        mock_dependencies["tool_manager"].get_tool_definitions.return_value = []
-        mock_dependencies["tool_manager"].get_last_sources.return_value = []
-
-        result, sources = rag_system.query(
-            "Follow up question", session_id="session123"
-        )
-
-        # Verify conversation history was retrieved
-        mock_dependencies[
-            "session_manager"
-        ].get_conversation_history.assert_called_once_with("session123")
-
-        # Verify AI generator received the history
-        mock_dependencies["ai_generator"].generate_response.assert_called_once_with(
-            query="Answer this question about course materials: Follow up question",
-            conversation_history="Previous conversation context",
-            tools=[],
-            tool_manager=mock_dependencies["tool_manager"],
-        )
-
-        # Verify conversation was updated
-        mock_dependencies["session_manager"].add_exchange.assert_called_once_with(
-            "session123", "Follow up question", "Contextual AI response"
-        )
-
-        assert result == "Contextual AI response"
+        assert returned_sources == sources
 
-    def test_query_tool_usage_flow(self, rag_system, mock_dependencies):
-        """Test full query flow when AI uses tools"""
-        # Setup tool definitions
-        tool_definitions = [
-            {"name": "search_course_content", "description": "Search courses"},
-            {"name": "get_course_outline", "description": "Get outline"},
-        ]
-
-        mock_dependencies["tool_manager"].get_tool_definitions.return_value = (
-            tool_definitions
-        )
-        mock_dependencies["ai_generator"].generate_response.return_value = (
-            "Response based on search results"
-        )
-        mock_dependencies["tool_manager"].get_last_sources.return_value = [
-            {"text": "ML Course - Lesson 1", "link": "http://example.com/ml/lesson1"},
-            {"text": "ML Course - Lesson 2", "link": "http://example.com/ml/lesson2"},
-        ]
-
-        result, sources = rag_system.query("Explain supervised learning")
-
-        # Verify tools were provided to AI
-        mock_dependencies["ai_generator"].generate_response.assert_called_once_with(
-            query="Answer this question about course materials: Explain supervised learning",
-            conversation_history=None,
-            tools=tool_definitions,
-            tool_manager=mock_dependencies["tool_manager"],
-        )
-
-        assert result == "Response based on search results"
-        assert len(sources) == 2
-        assert sources[0]["text"] == "ML Course - Lesson 1"
-
-    def test_add_course_document_success(
-        self, rag_system, mock_dependencies, sample_course, sample_course_chunks
+    @pytest.mark.parametrize("raises", [False, True], ids=["success", "error"])
+    def test_add_course_document(
+        self, rag_system, mock_dependencies, sample_course, sample_course_chunks, raises
     ):
-        """Test adding a single course document successfully"""
+        """Test adding a single course document, and the fallback when it fails"""
         # Setup mocks
-        mock_dependencies["document_processor"].process_course_document.return_value = (
-            sample_course,
-            sample_course_chunks,
+        process_course_document = (
+            mock_dependencies.document_processor.process_course_document
         )
+        process_course_document.return_value = (sample_course, sample_course_chunks)
+        if raises:
+            process_course_document.side_effect = Exception("Processing failed")
 
         course, chunk_count = rag_system.add_course_document("/path/to/course.pdf")
 
         # Verify document processing
-        mock_dependencies[
-            "document_processor"
-        ].process_course_document.assert_called_once_with("/path/to/course.pdf")
-
-        # Verify vector store operations
-        mock_dependencies["vector_store"].add_course_metadata.assert_called_once_with(
-            sample_course
-        )
-        mock_dependencies["vector_store"].add_course_content.assert_called_once_with(
-            sample_course_chunks
-        )
-
-        assert course == sample_course
-        assert chunk_count == len(sample_course_chunks)
+        process_course_document.assert_called_once_with("/path/to/course.pdf")
+
+        # On error the result is (None, 0) and the vector store is not called
+        vector_store = mock_dependencies.vector_store
+        if raises:
+            assert (course, chunk_count) == (None, 0)
+            vector_store.add_course_metadata.assert_not_called()
+            vector_store.add_course_content.assert_not_called()
+        else:
+            assert (course, chunk_count) == (sample_course, len(sample_course_chunks))
+            vector_store.add_course_metadata.assert_called_once_with(sample_course)
+            vector_store.add_course_content.assert_called_once_with(
+                sample_course_chunks
+            )
 
-    def test_add_course_document_error(self, rag_system, mock_dependencies):
-        """Test error handling when adding course document fails"""
-        # Setup mock to raise exception
-        mock_dependencies["document_processor"].process_course_document.side_effect = (
-            Exception("Processing failed")
+    @pytest.mark.parametrize(
+        "clear_existing,files,existing_titles,processed,added",
+        [
+            pytest.param(
+                True,
+                ["course1.pdf", "course2.txt", "ignored.doc"],
+                [],
+                2,
+                2,
+                id="clear_existing",
+            ),
+            pytest.param(
+                False, ["course1.pdf"], ["course1.pdf"], 1, 0, id="skip_existing"
+            ),
+            pytest.param(False, None, [], 0, 0, id="missing_dir"),
+        ],
+    )
+    def test_add_course_folder(
+        self,
+        rag_system,
+        mock_dependencies,
+        sample_course_chunks,
+        clear_existing,
+        files,
+        existing_titles,
+        processed,
+        added,
+    ):
+        """Test adding a course folder skips unsupported files and known courses"""
+        document_processor = mock_dependencies.document_processor
+        vector_store = mock_dependencies.vector_store
+        vector_store.get_existing_course_titles.return_value = existing_titles
+        # Title each course after its file so every file is a distinct course
+        document_processor.process_course_document.side_effect = lambda path: (
+            Course(title=os.path.basename(path)),
+            sample_course_chunks,
         )
 
-        course, chunk_count = rag_system.add_course_document("/path/to/invalid.pdf")
-
-        # Should return None and 0 on error
-        assert course is None
-        assert chunk_count == 0
-
-        # Vector store should not be called
-        mock_dependencies["vector_store"].add_course_metadata.assert_not_called()
-        mock_dependencies["vector_store"].add_course_content.assert_not_called()
-
-    def test_add_course_folder_with_clear_existing(
-        self, rag_system, mock_dependencies, sample_course, sample_course_chunks
-    ):
-        """Test adding course folder with clear_existing=True"""
+        # files=None stands for a folder that doesn't exist
         with (
-            patch("rag_system.os.path.exists", return_value=True),
-            patch(
-                "rag_system.os.listdir",
-                return_value=["course1.pdf", "course2.txt", "ignored.doc"],
+            patch.multiple(
+                "rag_system.os.path",
+                exists=Mock(return_value=files is not None),
+                isfile=Mock(return_value=True),
             ),
+            patch("rag_system.os.listdir", return_value=files or []),
         ):
-
-            # Setup mocks
-            mock_dependencies[
-                "vector_store"
-            ].get_existing_course_titles.return_value = []
-            mock_dependencies[
-                "document_processor"
-            ].process_course_document.return_value = (
-                sample_course,
-                sample_course_chunks,
-            )
-
             courses_added, chunks_added = rag_system.add_course_folder(
-                "/docs", clear_existing=True
+                "/docs", clear_existing=clear_existing
             )
 
-            # Verify clear was called
-            mock_dependencies["vector_store"].clear_all_data.assert_called_once()
-
-            # Verify processing of valid files (2 files: .pdf and .txt)
-            assert (
-                mock_dependencies[
-                    "document_processor"
-                ].process_course_document.call_count
-                == 2
-            )
-            assert courses_added == 2
-            assert chunks_added == len(sample_course_chunks) * 2
-
-    def test_add_course_folder_skip_existing(
-        self, rag_system, mock_dependencies, sample_course, sample_course_chunks
-    ):
-        """Test adding course folder skips existing courses"""
-        with (
-            patch("rag_system.os.path.exists", return_value=True),
-            patch("rag_system.os.listdir", return_value=["course1.pdf"]),
-        ):
-
-            # Setup mocks - course already exists
-            mock_dependencies[
-                "vector_store"
-            ].get_existing_course_titles.return_value = [sample_course.title]
-            mock_dependencies[
-                "document_processor"
-            ].process_course_document.return_value = (
-                sample_course,
-                sample_course_chunks,
-            )
-
-            courses_added, chunks_added = rag_system.add_course_folder("/docs")
-
-            # Should process but not add existing course
-            mock_dependencies[
-                "document_processor"
-            ].process_course_document.assert_called_once()
-            mock_dependencies["vector_store"].add_course_metadata.assert_not_called()
-            mock_dependencies["vector_store"].add_course_content.assert_not_called()
-
-            assert courses_added == 0
-            assert chunks_added == 0
-
-    def test_add_course_folder_nonexistent_directory(
-        self, rag_system, mock_dependencies
-    ):
-        """Test adding course folder when directory doesn't exist"""
-        with patch("rag_system.os.path.exists", return_value=False):
-
-            courses_added, chunks_added = rag_system.add_course_folder("/nonexistent")
-
-            assert courses_added == 0
-            assert chunks_added == 0
-
-            # No processing should occur
-            mock_dependencies[
-                "document_processor"
-            ].process_course_document.assert_not_called()
+        assert vector_store.clear_all_data.called == clear_existing
+        assert mock_dependencies.response_cache.clear.called == clear_existing
+        # Only .pdf, .docx and .txt files are processed
+        assert document_processor.process_course_document.call_count == processed
+        assert vector_store.add_course_metadata.call_count == added
+        assert courses_added == added
+        assert chunks_added == len(sample_course_chunks) * added
 
     def test_get_course_analytics(self, rag_system, mock_dependencies):
         """Test course analytics retrieval"""
-        mock_dependencies["vector_store"].get_course_count.return_value = 5
-        mock_dependencies["vector_store"].get_existing_course_titles.return_value = [
+        mock_dependencies.vector_store.get_course_count.return_value = 5
+        mock_dependencies.vector_store.get_existing_course_titles.return_value = [
             "Course A",
             "Course B",
             "Course C",
@@ -319,38 +303,22 @@ class TestRAGSystem:
         assert analytics["total_courses"] == 5
         assert analytics["course_titles"] == ["Course A", "Course B", "Course C"]
 
-    def test_query_prompt_formatting(self, rag_system, mock_dependencies):
-        """Test that query is properly formatted for AI"""
-        mock_dependencies["ai_generator"].generate_response.return_value = (
-            "Test response"
-        )
-        mock_dependencies["tool_manager"].get_tool_definitions.return_value = []
-        mock_dependencies["tool_manager"].get_last_sources.return_value = []
+    async def test_sources_collected_per_query(self, rag_system, mock_dependencies):
+        """Test that every query collects sources into its own list"""
+        generate_response = mock_dependencies.ai_generator.generate_response
+        first = [{"text": "Source 1", "link": "link1"}]
+        second = [{"text": "Source 2", "link": "link2"}]
 
-        rag_system.query("What is the capital of France?")
+        generate_response.side_effect = _answer_with_sources("Response", first)
+        _, first_sources = await rag_system.query("First query")
+        generate_response.side_effect = _answer_with_sources("Response", second)
+        _, second_sources = await rag_system.query("Second query")
 
-        # Verify the query was wrapped with the instruction
-        call_args = mock_dependencies["ai_generator"].generate_response.call_args[1]
-        expected_query = "Answer this question about course materials: What is the capital of France?"
-        assert call_args["query"] == expected_query
+        assert first_sources == first
+        assert second_sources == second
 
-    def test_sources_lifecycle(self, rag_system, mock_dependencies):
-        """Test that sources are properly retrieved and reset"""
-        test_sources = [{"text": "Source 1", "link": "link1"}]
-        mock_dependencies["tool_manager"].get_last_sources.return_value = test_sources
-        mock_dependencies["ai_generator"].generate_response.return_value = "Response"
-        mock_dependencies["tool_manager"].get_tool_definitions.return_value = []
-
-        result, sources = rag_system.query("Test query")
-
-        # Verify sources were retrieved before reset
-        mock_dependencies["tool_manager"].get_last_sources.assert_called_once()
-        mock_dependencies["tool_manager"].reset_sources.assert_called_once()
-
-        # Verify reset was called after get_last_sources
-        calls = [call[0] for call in mock_dependencies["tool_manager"].method_calls]
-        get_sources_index = calls.index("get_last_sources")
-        reset_sources_index = calls.index("reset_sources")
-        assert reset_sources_index > get_sources_index
-
-        assert sources == test_sources
+        # Sources never pass through the shared tool manager
+        assert mock_dependencies.tool_manager.method_calls == [
+            call.get_tool_definitions(),
+            call.get_tool_definitions(),
+        ]
@@ -0,0 +1,103 @@
+from unittest.mock import Mock, patch
+
+import pytest
+from response_cache import SemanticResponseCache
+
+
+@pytest.fixture
+def cache():
+    """Response cache over a mock vector store client"""
+    vector_store = Mock()
+    return SemanticResponseCache(vector_store, similarity_threshold=0.9, ttl_seconds=60)
+
+
+def _neighbours(cache, *entries):
+    """Make the cache collection return (id, distance, metadata) neighbours"""
+    ids, distances, metadatas = zip(*entries)
+    cache.collection.query.return_value = {
+        "ids": [list(ids)],
+        "distances": [list(distances)],
+        "metadatas": [list(metadatas)],
+    }
+
+
+class TestSemanticResponseCache:
+    """Test suite for SemanticResponseCache lookups, expiry and clearing"""
+
+    @pytest.mark.parametrize(
+        "distance,age,expected",
+        [
+            (0.05, 10, "Cached answer"),
+            # Similarity 0.8 is under the 0.9 threshold
+            (0.2, 10, None),
+            # Older than the 60 second TTL
+            (0.05, 61, None),
+        ],
+        ids=["fresh_hit", "too_dissimilar", "expired"],
+    )
+    def test_get(self, cache, distance, age, expected):
+        """Test get returns only similar answers written within the TTL"""
+        _neighbours(
+            cache, ("q1", distance, {"answer": "Cached answer", "created_at": 1000.0})
+        )
+
+        with patch("response_cache.time.time", return_value=1000.0 + age):
+            assert cache.get("question") == expected
+
+    def test_get_without_timestamp_is_expired(self, cache):
+        """Test entries stored before expiry tracking are not served"""
+        _neighbours(cache, ("q1", 0.05, {"answer": "Old answer"}))
+
+        assert cache.get("question") is None
+
+    def test_get_skips_expired_nearest_entry(self, cache):
+        """Test a fresh paraphrase behind an expired nearest entry still hits"""
+        _neighbours(
+            cache,
+            ("old", 0.01, {"answer": "Old answer", "created_at": 900.0}),
+            ("new", 0.05, {"answer": "New answer", "created_at": 990.0}),
+        )
+
+        with patch("response_cache.time.time", return_value=1000.0):
+            assert cache.get("question") == "New answer"
+
+    def test_get_deletes_expired_entries(self, cache):
+        """Test expired neighbours found by a lookup are removed"""
+        _neighbours(
+            cache,
+            ("old", 0.01, {"answer": "Old answer", "created_at": 900.0}),
+            ("new", 0.05, {"answer": "New answer", "created_at": 990.0}),
+        )
+
+        with patch("response_cache.time.time", return_value=1000.0):
+            cache.get("question")
+
+        cache.collection.delete.assert_called_once_with(ids=["old"])
+
+    def test_set_records_creation_time(self, cache):
+        """Test set stores the answer with the time it was written"""
+        with patch("response_cache.time.time", return_value=1234.0):
+            cache.set("question", "answer")
+
+        metadatas = cache.collection.upsert.call_args.kwargs["metadatas"]
+        assert metadatas == [{"answer": "answer", "created_at": 1234.0}]
+
+    def test_set_prunes_expired_entries(self, cache):
+        """Test set removes entries older than the TTL"""
+        with patch("response_cache.time.time", return_value=1234.0):
+            cache.set("question", "answer")
+
+        cache.collection.delete.assert_called_once_with(
+            where={"created_at": {"$lt": 1174.0}}
+        )
+
+    def test_clear(self, cache):
+        """Test clear drops the collection and starts a fresh one"""
+        client = cache.vector_store.client
+        fresh = Mock()
+        client.get_or_create_collection.return_value = fresh
+
+        cache.clear()
+
+        client.delete_collection.assert_called_once_with("response_cache")
+        assert cache.collection is fresh
@@ -2,9 +2,9 @@ from dataclasses import dataclass
 from typing import Any, Dict, List, Optional
 
 import chromadb
+import orjson
 from chromadb.config import Settings
 from models import Course, CourseChunk
-from sentence_transformers import SentenceTransformer
 
 
 @dataclass
@@ -149,8 +149,6 @@ class VectorStore:
 
     def add_course_metadata(self, course: Course):
         """Add course information to the catalog for semantic search"""
-        import json
-
         course_text = course.title
 
         # Build lessons metadata and serialize as JSON string
@@ -171,9 +169,9 @@ class VectorStore:
                     "title": course.title,
                     "instructor": course.instructor,
                     "course_link": course.course_link,
-                    "lessons_json": json.dumps(
+                    "lessons_json": orjson.dumps(
                         lessons_metadata
-                    ),  # Serialize as JSON string
+                    ).decode(),  # Serialize as JSON string
                     "lesson_count": len(course.lessons),
                 }
             ],
@@ -238,8 +236,6 @@ class VectorStore:
 
     def get_all_courses_metadata(self) -> List[Dict[str, Any]]:
         """Get metadata for all courses in the vector store"""
-        import json
-
         try:
             results = self.course_catalog.get()
             if results and "metadatas" in results:
@@ -248,7 +244,9 @@ class VectorStore:
                 for metadata in results["metadatas"]:
                     course_meta = metadata.copy()
                     if "lessons_json" in course_meta:
-                        course_meta["lessons"] = json.loads(course_meta["lessons_json"])
+                        course_meta["lessons"] = orjson.loads(
+                            course_meta["lessons_json"]
+                        )
                         del course_meta[
                             "lessons_json"
                         ]  # Remove the JSON string version
@@ -274,8 +272,6 @@ class VectorStore:
 
     def get_lesson_link(self, course_title: str, lesson_number: int) -> Optional[str]:
         """Get lesson link for a given course title and lesson number"""
-        import json
-
         try:
             # Get course by ID (title is the ID)
             results = self.course_catalog.get(ids=[course_title])
@@ -283,7 +279,7 @@ class VectorStore:
                 metadata = results["metadatas"][0]
                 lessons_json = metadata.get("lessons_json")
                 if lessons_json:
-                    lessons = json.loads(lessons_json)
+                    lessons = orjson.loads(lessons_json)
                     # Find the lesson with matching number
                     for lesson in lessons:
                         if lesson.get("lesson_number") == lesson_number: